@@ -0,0 +1,281 @@
+import os
+import time
+from typing import Any, Dict, Iterable, Optional
+
+import faiss
+import numpy as np
+
+# Corpus-size thresholds for picking an index type
+FLAT_MAX_VECTORS = 20_000
+HNSW_MAX_VECTORS = 500_000
+
+# How vectors are stored in the index: full float32, or compressed codes that
+# are reranked against the full vectors kept on disk
+COMPRESSIONS = ("none", "fp16", "sq8", "pq")
+VECTOR_COMPRESSION = os.getenv("VECTOR_COMPRESSION", "none")
+# Codes are trained once this many vectors exist (39 points per PQ centroid)
+COMPRESS_MIN_VECTORS = 10_000
+
+
+class IndexConfig:
+    """How to index a document's vectors; the search knobs trade latency for recall."""
+
+    def __init__(
+        self,
+        kind: str = "auto",  # "auto", "flat", "hnsw" or "ivf"
+        flat_max_vectors: int = FLAT_MAX_VECTORS,
+        hnsw_max_vectors: int = HNSW_MAX_VECTORS,
+        hnsw_m: int = 32,
+        hnsw_ef_construction: int = 80,
+        hnsw_ef_search: int = 64,
+        ivf_nlist: Optional[int] = None,
+        ivf_nprobe: int = 16,
+        compression: str = VECTOR_COMPRESSION,
+        compress_min_vectors: int = COMPRESS_MIN_VECTORS,
+        pq_m: int = 48,
+        rerank_factor: int = 4,
+    ):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown vector compression '{compression}' (choose from {', '.join(COMPRESSIONS)})")
+        self.kind = kind
+        self.flat_max_vectors = flat_max_vectors
+        self.hnsw_max_vectors = hnsw_max_vectors
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construction = hnsw_ef_construction
+        self.hnsw_ef_search = hnsw_ef_search
+        self.ivf_nlist = ivf_nlist
+        self.ivf_nprobe = ivf_nprobe
+        self.compression = compression
+        self.compress_min_vectors = compress_min_vectors
+        # PQ sub-quantizers, one byte each; 48 splits MiniLM's 384 dims into groups of 8
+        self.pq_m = pq_m
+        # Compressed searches fetch rerank_factor * k candidates for exact rescoring
+        self.rerank_factor = rerank_factor
+
+    def choose_kind(self, n_vectors: int) -> str:
+        if self.kind != "auto":
+            return self.kind
+        if n_vectors <= self.flat_max_vectors:
+            return "flat"
+        if n_vectors <= self.hnsw_max_vectors:
+            return "hnsw"
+        return "ivf"
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize in place (copying first if needed) so inner product is cosine."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if not vectors.flags.writeable:
+        vectors = vectors.copy()
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def _pq_subquantizers(dimension: int, m: int) -> int:
+    """Largest sub-quantizer count <= m that divides the dimension."""
+    m = max(1, min(m, dimension))
+    while dimension % m:
+        m -= 1
+    return m
+
+
+def bytes_per_vector(dimension: int, compression: str, pq_m: int = 48) -> int:
+    if compression == "fp16":
+        return 2 * dimension
+    if compression == "sq8":
+        return dimension
+    if compression == "pq":
+        return _pq_subquantizers(dimension, pq_m)
+    return 4 * dimension
+
+
+def new_coded_index(dimension: int, compression: str, config: IndexConfig, nlist: int = 1):
+    """Untrained inner-product index storing compressed codes.
+
+    nlist=1 is an exhaustive scan. Scalar quantizers without IVF go in a flat
+    code index; PQ always uses IVFPQ, which unlike IndexPQ accepts id
+    selectors, with a single list standing in for flat.
+    """
+    if compression in ("fp16", "sq8"):
+        qtype = faiss.ScalarQuantizer.QT_fp16 if compression == "fp16" else faiss.ScalarQuantizer.QT_8bit
+        if nlist == 1:
+            return faiss.IndexScalarQuantizer(dimension, qtype, faiss.METRIC_INNER_PRODUCT)
+        return faiss.IndexIVFScalarQuantizer(faiss.IndexFlatIP(dimension), dimension, nlist, qtype,
+                                             faiss.METRIC_INNER_PRODUCT)
+    if compression == "pq":
+        m = _pq_subquantizers(dimension, config.pq_m)
+        index = faiss.IndexIVFPQ(faiss.IndexFlatIP(dimension), dimension, nlist, m, 8, faiss.METRIC_INNER_PRODUCT)
+        index.by_residual = nlist > 1
+        # Small corpora train on fewer points than FAISS recommends; don't warn about it
+        index.cp.min_points_per_centroid = 1
+        index.pq.cp.min_points_per_centroid = 1
+        return index
+    raise ValueError(f"Not a compressed format: {compression}")
+
+
+def train_sample(vectors: np.ndarray, size: int) -> np.ndarray:
+    if len(vectors) <= size:
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+    return np.ascontiguousarray(vectors[np.sort(np.random.default_rng(0).choice(len(vectors), size, replace=False))],
+                                dtype=np.float32)
+
+
+def rerank(query: np.ndarray, candidates, full_vectors, k: int):
+    """Rescore (key, row) candidates with exact inner products against full_vectors(key)[row]."""
+    by_key: Dict[Any, list] = {}
+    for position, (key, row) in enumerate(candidates):
+        by_key.setdefault(key, []).append((position, row))
+    scored = []
+    for key, members in by_key.items():
+        rows = np.array([row for _, row in members], dtype=np.int64)
+        scores = np.asarray(full_vectors(key)[rows], dtype=np.float32) @ query
+        scored.extend((float(score), key, int(row)) for score, row in zip(scores, rows))
+    scored.sort(key=lambda hit: hit[0], reverse=True)
+    return scored[:k]
+
+
+def apply_search_params(index, config: IndexConfig):
+    """Set the recall/latency knobs on an already built (or loaded) index."""
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = config.hnsw_ef_search
+    elif isinstance(index, faiss.IndexIVF):
+        index.nprobe = config.ivf_nprobe
+
+
+def build_ann_index(vectors: np.ndarray, config: IndexConfig, kind: Optional[str] = None):
+    """Build an inner-product index over normalized vectors, training it if needed."""
+    n_vectors, dimension = vectors.shape
+    kind = kind or config.choose_kind(n_vectors)
+
+    if kind == "flat":
+        index = faiss.IndexFlatIP(dimension)
+    elif kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, config.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = config.hnsw_ef_construction
+    elif kind == "ivf":
+        # ~4*sqrt(N) lists, and keep at least 39 training points per list
+        nlist = config.ivf_nlist or int(4 * np.sqrt(n_vectors))
+        nlist = max(1, min(nlist, n_vectors // 39))
+        quantizer = faiss.IndexFlatIP(dimension)
+        index = faiss.IndexIVFFlat(quantizer, dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+        train_size = min(n_vectors, nlist * 256)
+        sample = vectors[np.random.default_rng(0).choice(n_vectors, train_size, replace=False)]
+        index.train(sample)
+    else:
+        raise ValueError(f"Unknown index kind: {kind}")
+
+    index.add(vectors)
+    apply_search_params(index, config)
+    return index
+
+
+def _timed_search(index, queries: np.ndarray, k: int):
+    start = time.perf_counter()
+    _, ids = index.search(queries, k)
+    return ids, (time.perf_counter() - start) / len(queries)
+
+
+def recall_report(
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    config: IndexConfig,
+    k: int = 5,
+    kinds: Iterable[str] = ("hnsw", "ivf"),
+    ef_search_values: Iterable[int] = (16, 32, 64, 128),
+    nprobe_values: Iterable[int] = (1, 4, 16, 64),
+) -> Dict[str, Any]:
+    """Recall@k and per-query latency of ANN settings against the flat baseline."""
+    vectors = normalize(vectors)
+    queries = normalize(queries)
+    k = min(k, len(vectors))
+
+    flat = build_ann_index(vectors, config, kind="flat")
+    truth, flat_latency = _timed_search(flat, queries, k)
+    report: Dict[str, Any] = {
+        "vectors": len(vectors),
+        "queries": len(queries),
+        "k": k,
+        "flat_ms_per_query": round(flat_latency * 1000, 4),
+        "settings": [],
+    }
+
+    for kind in kinds:
+        index = build_ann_index(vectors, config, kind=kind)
+        if kind == "hnsw":
+            sweep = [("efSearch", value) for value in ef_search_values]
+        else:
+            sweep = [("nprobe", min(value, index.nlist)) for value in nprobe_values]
+
+        for param, value in sweep:
+            if param == "efSearch":
+                index.hnsw.efSearch = value
+            else:
+                index.nprobe = value
+            ids, latency = _timed_search(index, queries, k)
+            hits = sum(len(set(row) & set(expected)) for row, expected in zip(ids, truth))
+            report["settings"].append({
+                "kind": kind,
+                param: value,
+                "recall_at_k": round(hits / truth.size, 4),
+                "ms_per_query": round(latency * 1000, 4),
+                "speedup": round(flat_latency / latency, 2) if latency else None,
+            })
+
+    return report
+
+
+def compression_report(
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    config: IndexConfig,
+    k: int = 5,
+    compressions: Iterable[str] = COMPRESSIONS,
+    rerank_factors: Iterable[int] = (1, 4),
+) -> Dict[str, Any]:
+    """Index memory against recall@k for each vector compression, with and without reranking."""
+    vectors = normalize(vectors)
+    queries = normalize(queries)
+    n_vectors, dimension = vectors.shape
+    k = min(k, n_vectors)
+
+    flat = build_ann_index(vectors, config, kind="flat")
+    _, truth = flat.search(queries, k)
+    full_bytes = n_vectors * bytes_per_vector(dimension, "none")
+    report: Dict[str, Any] = {"vectors": n_vectors, "queries": len(queries), "k": k, "settings": []}
+
+    for compression in compressions:
+        code_bytes = n_vectors * bytes_per_vector(dimension, compression, config.pq_m)
+        setting = {
+            "compression": compression,
+            "index_mb": round(code_bytes / (1024 * 1024), 3),
+            "memory_saved": round(1 - code_bytes / full_bytes, 3),
+        }
+        if compression == "none":
+            report["settings"].append({**setting, "rerank_factor": 1, "recall_at_k": 1.0})
+            continue
+        if compression == "pq" and n_vectors < 256:
+            report["settings"].append({**setting, "skipped": "PQ needs at least 256 vectors to train"})
+            continue
+
+        index = new_coded_index(dimension, compression, config)
+        index.train(train_sample(vectors, 65_536))
+        index.add(vectors)
+        for factor in rerank_factors:
+            start = time.perf_counter()
+            _, candidates = index.search(queries, min(k * factor, n_vectors))
+            if factor > 1:
+                ids = np.array([[row for _, _, row in rerank(query, [(0, int(c)) for c in row if c != -1],
+                                                             lambda _: vectors, k)]
+                                for query, row in zip(queries, candidates)])
+            else:
+                ids = candidates
+            latency = (time.perf_counter() - start) / len(queries)
+            hits = sum(len(set(row) & set(expected)) for row, expected in zip(ids, truth))
+            report["settings"].append({
+                **setting,
+                "rerank_factor": factor,
+                "recall_at_k": round(hits / truth.size, 4),
+                "ms_per_query": round(latency * 1000, 4),
+            })
+
+    return report
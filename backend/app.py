@@ -1,17 +1,38 @@
 # app.py - Minimal working version with performance improvements
-from fastapi import FastAPI, UploadFile, Form, BackgroundTasks
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, Form, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-import tempfile
 import os
 import asyncio
+import json
+import threading
+import time
 import uuid
-from typing import Dict, Any
+from collections import deque
+from typing import Any, Dict, Optional
 
 # Import your existing modules
-from parser import parse_pdf, smart_chunk_text
 from embedder import OptimizedEmbedder  
-from llm import query_llm
+from pipeline import IngestionProgress, ingest_pdf
+from parser import CHUNKER_VERSION
+from summarizer import MapReduceSummarizer
+from llm import aquery_llm, astream_llm, llm_client, llm_cache, llm_pool
+from llm_cache import ERROR_PREFIX
+from model_registry import DEFAULT_MODEL_NAME, get_model, model_registry
+from index_store import IndexStore, content_key
+from corpus_index import CorpusIndex, DocumentRetriever
+from lexical_index import DEFAULT_RETRIEVAL_MODE, RETRIEVAL_MODES
+from query_batcher import QueryBatcher
+from chunk_store import ChunkStore
+from context_builder import CONTEXT_TOKEN_BUDGET, build_context
+from session_manager import SessionManager
+from session_backend import get_session_backend
+from metrics import (
+    HTTP_REQUEST_SECONDS, LLM_BACKEND_OUTSTANDING, LLM_BACKEND_UP, QUEUE_DEPTH, SESSION_MEMORY_BYTES, SESSIONS,
+    detach_trace, finish_trace, recent_traces, render_metrics, span, start_trace,
+)
+from uploads import MAX_UPLOAD_BYTES, UploadTooLarge, stream_upload_to_disk
+from ingest_scheduler import DEFAULT_PRIORITY, PRIORITIES, IngestionCancelled, IngestionScheduler
 
 # ====== GLOBALS ======
 app = FastAPI(title="AI PDF Processor", description="Process large PDFs with AI")
@@ -25,45 +46,100 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# In-memory storage for demo
-pdf_sessions: Dict[str, Dict[str, Any]] = {}
+# Chunking parameters are part of the index store key
+CHUNK_SIZE = 1200
+CHUNK_OVERLAP = 200
+
+# Persistent indexes keyed by PDF content, survive restarts and re-uploads
+index_store = IndexStore()
+
+# One vector index shared by every session; each session is a document in it
+corpus_index = CorpusIndex()
+
+# Concurrent chat queries share one encode() and one search() per batch window
+query_batcher = QueryBatcher(
+    corpus_index,
+    max_batch_size=int(os.getenv("QUERY_BATCH_MAX_SIZE", "32")),
+    max_wait_ms=float(os.getenv("QUERY_BATCH_WAIT_MS", "5")),
+)
+
+def make_retriever(session_id: str) -> DocumentRetriever:
+    return DocumentRetriever(corpus_index, session_id, batcher=query_batcher)
+
+# Bounded number of concurrent parse/embed jobs; the rest wait in a priority queue
+ingest_scheduler = IngestionScheduler()
+
+# Session store with a memory budget: idle sessions expire, LRU ones spill to disk.
+# SESSION_BACKEND=sqlite shares sessions between uvicorn workers; deleting a
+# session also cancels its ingestion if still queued or running.
+pdf_sessions = SessionManager(
+    corpus_index,
+    index_store,
+    make_retriever,
+    backend=get_session_backend(),
+    on_delete=ingest_scheduler.cancel,
+)
+
+# Gauges read at scrape time from the live objects
+QUEUE_DEPTH.labels("ingest_queued").set_function(lambda: ingest_scheduler.stats()["queued"])
+QUEUE_DEPTH.labels("ingest_running").set_function(lambda: ingest_scheduler.stats()["running"])
+QUEUE_DEPTH.labels("query_batch").set_function(query_batcher.queue_depth)
+SESSION_MEMORY_BYTES.labels("resident").set_function(pdf_sessions.resident_bytes)
+SESSION_MEMORY_BYTES.labels("budget").set_function(lambda: pdf_sessions.memory_budget_bytes)
+SESSIONS.labels("resident").set_function(lambda: pdf_sessions.stats()["resident_sessions"])
+SESSIONS.labels("spilled").set_function(lambda: pdf_sessions.stats()["spilled_sessions"])
+for _backend in llm_pool.backends:
+    LLM_BACKEND_UP.labels(_backend.url).set_function(lambda b=_backend: int(b.up(time.monotonic())))
+    LLM_BACKEND_OUTSTANDING.labels(_backend.url).set_function(lambda b=_backend: b.outstanding)
 
 class ProcessingStatus:
     UPLOADING = "uploading"
+    QUEUED = "queued"
     PARSING = "parsing" 
     CHUNKING = "chunking"
     INDEXING = "indexing"
     READY = "ready"
     ERROR = "error"
 
+@app.on_event("startup")
+async def warm_up_models():
+    """Load the shared embedding model before the first upload arrives"""
+    await asyncio.to_thread(get_model)
+
+@app.on_event("startup")
+async def start_session_sweeper():
+    """Expire idle sessions and keep resident sessions within the memory budget"""
+    app.state.session_sweeper = asyncio.create_task(pdf_sessions.run_sweeper())
+
+@app.on_event("startup")
+async def start_ingest_scheduler():
+    ingest_scheduler.start()
+
+@app.on_event("shutdown")
+async def stop_ingest_scheduler():
+    await ingest_scheduler.stop()
+
+@app.on_event("startup")
+async def start_llm_health_checks():
+    """Probe every Ollama backend in the background; /health reads the cached result"""
+    llm_pool.start()
+
+@app.on_event("shutdown")
+async def close_llm_client():
+    await llm_pool.stop()
+    await llm_client.aclose()
+
 # ========= Helper Functions =========
-def summarize_chunks_batch(chunks, batch_size=5):
-    """Summarize chunks in batches for better performance"""
-    summaries = []
-    
-    # Process in batches
-    for i in range(0, min(len(chunks), 20), batch_size):  # Limit to first 20 chunks
-        batch_chunks = chunks[i:i + batch_size]
-        batch_text = "\n\n".join(batch_chunks)
-        
-        prompt = f"Summarize this section concisely, focusing on main points:\n\n{batch_text[:2000]}"
-        summary = query_llm(prompt, model="llama3")
-        summaries.append(summary)
-    
-    return summaries
+NO_CONTEXT_ANSWER = "I couldn't find relevant information in the document to answer your question."
 
-def create_final_summary(chunk_summaries):
-    """Create final summary from chunk summaries"""
-    combined_summaries = "\n\n".join(chunk_summaries)
-    
-    prompt = f"Create a comprehensive summary from these section summaries:\n\n{combined_summaries}"
-    return query_llm(prompt, model="llama3")
+# More candidates than fit: the context builder keeps the best ones within the token budget
+RETRIEVAL_CANDIDATES = 8
 
-def generate_faqs_from_chunks(chunks, num_questions=5):
-    """Generate FAQs from document chunks"""
+def build_faq_prompt(chunks, num_questions=5):
+    """Build the FAQ prompt from document chunks"""
     content = "\n\n".join(chunks[:3])[:2000]  # Use first 3 chunks
     
-    prompt = f"""Based on this content, generate {num_questions} frequently asked questions with detailed answers:
+    return f"""Based on this content, generate {num_questions} frequently asked questions with detailed answers:
 
 {content}
 
@@ -75,26 +151,35 @@ Q2: [Question]
 A2: [Answer]
 
 etc."""
-    
-    return query_llm(prompt, model="llama3")
 
-def generate_answer_from_context(question, retriever, max_context_length=2000):
-    """Generate answer using retrieved context"""
-    # Get relevant chunks
-    relevant_chunks = retriever.query(question, top_k=5)
+async def generate_faqs_from_chunks(chunks, num_questions=5):
+    """Generate FAQs from document chunks"""
+    return await aquery_llm(build_faq_prompt(chunks, num_questions), model="llama3")
+
+async def build_answer_prompt(question, retriever, token_budget=CONTEXT_TOKEN_BUDGET, mode=DEFAULT_RETRIEVAL_MODE,
+                              cited_pages=None):
+    """Retrieve context for a question; returns None when nothing relevant is found.
     
-    if not relevant_chunks:
-        return "I couldn't find relevant information in the document to answer your question."
+    Pages the context was taken from are appended to cited_pages, if given.
+    """
+    def retrieve():
+        # Embedding, search and token counting are CPU work, keep them off the loop
+        hits = retriever.query_hits(question, RETRIEVAL_CANDIDATES, mode)
+        if not hits:
+            return None
+        # Overlapping neighbours are merged and packed by relevance into the token budget
+        sources = []
+        with span("context"):
+            context = build_context(hits, retriever.chunks, token_budget, sources=sources)
+        if cited_pages is not None:
+            cited_pages.extend(retriever.pages_for(sources))
+        return context
     
-    # Combine chunks, respecting max context length
-    context = ""
-    for chunk in relevant_chunks:
-        if len(context) + len(chunk) <= max_context_length:
-            context += chunk + "\n\n"
-        else:
-            break
+    context = await asyncio.to_thread(retrieve)
+    if not context:
+        return None
     
-    prompt = f"""Based on the following context from the document, answer the user's question accurately. If the answer is not in the context, say so.
+    return f"""Based on the following context from the document, answer the user's question accurately. If the answer is not in the context, say so.
 
 Context:
 {context}
@@ -102,13 +187,133 @@ Context:
 Question: {question}
 
 Answer:"""
+
+async def generate_answer_from_context(question, retriever, token_budget=CONTEXT_TOKEN_BUDGET, mode=DEFAULT_RETRIEVAL_MODE,
+                                       cited_pages=None):
+    """Generate answer using retrieved context"""
+    prompt = await build_answer_prompt(question, retriever, token_budget, mode, cited_pages)
+    if prompt is None:
+        return NO_CONTEXT_ANSWER
     
-    return query_llm(prompt, model="llama3")
+    return await aquery_llm(prompt, model="llama3")
+
+async def get_ready_session(session_id: str):
+    """Return (session, None) or (None, error response) for a session that must be READY"""
+    if session_id not in pdf_sessions:
+        return None, JSONResponse(status_code=404, content={"error": "Session not found"})
+    
+    session = pdf_sessions[session_id]
+    if session["status"] != ProcessingStatus.READY:
+        return None, JSONResponse(status_code=400, content={
+            "error": f"PDF not ready. Status: {session['status']}"
+        })
+    
+    try:
+        await pdf_sessions.ensure_resident(session_id)
+    except Exception as e:
+        return None, JSONResponse(status_code=500, content={"error": str(e)})
+    return session, None
+
+# ========= Streaming (Server-Sent Events) =========
+# Recent timings per streaming endpoint, newest last
+stream_timings: Dict[str, deque] = {}
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def record_stream_timing(endpoint: str, timing: Dict[str, float]):
+    stream_timings.setdefault(endpoint, deque(maxlen=100)).append(timing)
+
+async def stream_llm_events(endpoint: str, prompt: str, started: float, prep_seconds: float,
+                            done_extra: Optional[Dict[str, Any]] = None):
+    """Forward Ollama tokens as SSE, then a final event with timings (and done_extra)"""
+    first_token_at = None
+    try:
+        async for token in astream_llm(prompt, model="llama3"):
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            yield sse_event("token", {"token": token})
+    except Exception as e:
+        yield sse_event("error", {"error": f"{ERROR_PREFIX}: {e}"})
+        return
+    
+    finished = time.perf_counter()
+    timing = {
+        "prep_seconds": round(prep_seconds, 3),
+        "ttft_seconds": round((first_token_at or finished) - started, 3),
+        "total_seconds": round(finished - started, 3),
+        "generation_seconds": round(finished - (first_token_at or finished), 3),
+    }
+    record_stream_timing(endpoint, timing)
+    yield sse_event("done", {**timing, **(done_extra or {})})
+
+def sse_response(events) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 # ========= STEP 1: Upload & Process PDF (Async) =========
+# Room for multipart boundaries and headers on top of the file itself
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    """Refuse uploads whose declared size is over the limit before reading the body"""
+    if request.url.path == "/upload_pdf/":
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and \
+                int(content_length) > MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES:
+            return JSONResponse(status_code=413, content={
+                "error": f"Upload exceeds the {MAX_UPLOAD_BYTES // (1024 * 1024)} MB limit"
+            })
+    return await call_next(request)
+
+# Registered last so it wraps everything, including the upload size check
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Give every request a trace id and record its latency per route.
+
+    The trace closes once the body has been sent, so streamed answers are
+    recorded with their full duration and LLM spans.
+    """
+    trace, token = start_trace(request.headers.get("x-trace-id"), f"{request.method} {request.url.path}")
+
+    def record_request(status: int):
+        record = finish_trace(trace, status)
+        # Route template, not the raw path, keeps session ids out of the label set
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        HTTP_REQUEST_SECONDS.labels(request.method, route, status).observe(record["duration_ms"] / 1000)
+
+    try:
+        response = await call_next(request)
+    except Exception:
+        record_request(500)
+        raise
+    finally:
+        detach_trace(token)
+
+    body = response.body_iterator
+
+    async def traced_body():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            record_request(response.status_code)
+
+    response.body_iterator = traced_body()
+    response.headers["X-Trace-Id"] = trace.trace_id
+    return response
+
 @app.post("/upload_pdf/")
-async def upload_pdf(background_tasks: BackgroundTasks, file: UploadFile):
+async def upload_pdf(file: UploadFile, priority: str = Form(DEFAULT_PRIORITY)):
     """Upload and process PDF asynchronously"""
+    if priority not in PRIORITIES:
+        return JSONResponse(status_code=400, content={
+            "error": f"Unknown priority '{priority}'. Use one of: {', '.join(PRIORITIES)}"
+        })
     
     # Generate session ID
     session_id = str(uuid.uuid4())
@@ -123,44 +328,127 @@ async def upload_pdf(background_tasks: BackgroundTasks, file: UploadFile):
         "error": None
     }
     
-    # Save uploaded PDF temporarily
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-        content = await file.read()
-        tmp_file.write(content)
-        tmp_path = tmp_file.name
+    # Stream to disk in fixed-size chunks, hashing on the fly for deduplication
+    try:
+        upload = await stream_upload_to_disk(file)
+    except UploadTooLarge as e:
+        del pdf_sessions[session_id]
+        return JSONResponse(status_code=413, content={"error": str(e)})
+    tmp_path = upload.pop("path")
+    pdf_sessions[session_id]["upload"] = upload
+    
+    store_key = content_key(
+        upload["sha256"],
+        model=DEFAULT_MODEL_NAME,
+        chunk_size=CHUNK_SIZE,
+        overlap=CHUNK_OVERLAP,
+        chunker=CHUNKER_VERSION,
+        metric="cosine",
+    )
+    pdf_sessions[session_id]["content_key"] = store_key
+    
+    # Already seen this document: skip parsing and embedding entirely
+    stored = await asyncio.to_thread(index_store.load, store_key)
+    if stored is not None:
+        os.remove(tmp_path)
+        await asyncio.to_thread(corpus_index.add_document, session_id, stored["chunks"], stored["vectors"],
+                                stored["meta"].get("chunk_pages"))
+        retriever = make_retriever(session_id)
+        pdf_sessions[session_id].update({
+            "status": ProcessingStatus.READY,
+            "progress": 100,
+            "retriever": retriever,
+            "chunks": stored["chunks"],
+            "chunks_count": len(stored["chunks"]),
+            "document_stats": stored["chunks"].stats(),
+            "text_length": stored["meta"].get("text_length", 0),
+            "page_count": stored["meta"].get("page_count"),
+            "from_store": True
+        })
+        pdf_sessions.account(session_id)
+        return {
+            "session_id": session_id,
+            "status": ProcessingStatus.READY,
+            "message": f"{file.filename} loaded from index store"
+        }
     
-    # Process in background
-    background_tasks.add_task(process_pdf_background, session_id, tmp_path, file.filename)
+    # Queue for processing; a cancelled job that never started still removes its file
+    pdf_sessions[session_id]["status"] = ProcessingStatus.QUEUED
+    pdf_sessions[session_id]["priority"] = priority
+    position = await ingest_scheduler.submit(
+        session_id,
+        lambda cancel: process_pdf_background(session_id, tmp_path, file.filename, cancel),
+        priority=priority,
+        on_cancel=lambda: os.remove(tmp_path),
+    )
     
     return {
         "session_id": session_id,
         "status": "processing_started",
+        "queue_position": position,
         "message": f"Processing {file.filename}..."
     }
 
-async def process_pdf_background(session_id: str, tmp_path: str, filename: str):
-    """Background task to process PDF"""
+async def process_pdf_background(session_id: str, tmp_path: str, filename: str, cancel: threading.Event):
+    """Scheduled job to process PDF; stops early once cancel is set"""
     try:
         session = pdf_sessions[session_id]
         
-        # Step 1: Parse PDF
         session["status"] = ProcessingStatus.PARSING
-        session["progress"] = 20
-        pdf_text = parse_pdf(tmp_path)
         
-        if len(pdf_text) < 100:
+        def on_progress(stage: str, progress: IngestionProgress):
+            # Parsing, chunking and embedding overlap; report from real counts
+            parsing = progress.pages_done < progress.page_count
+            session["status"] = ProcessingStatus.PARSING if parsing else ProcessingStatus.INDEXING
+            session["progress"] = progress.percent
+            session["pipeline"] = progress.as_dict()
+        
+        # Steps 1-3: Streamed parse -> chunk -> embed (vectors go to the corpus index)
+        embedder = OptimizedEmbedder(index_vectors=False)
+        result = await asyncio.to_thread(
+            ingest_pdf,
+            tmp_path,
+            embedder,
+            chunk_size=CHUNK_SIZE,
+            overlap=CHUNK_OVERLAP,
+            on_progress=on_progress,
+            workers=ingest_scheduler.workers_per_job(),
+            cancel=cancel,
+        )
+        if result["text_length"] < 100 or not result["chunks"]:
             raise Exception("PDF appears to be empty or corrupted")
         
-        # Step 2: Smart chunking
-        session["status"] = ProcessingStatus.CHUNKING  
-        session["progress"] = 40
-        chunks = smart_chunk_text(pdf_text, chunk_size=1200, overlap=200)
+        # One UTF-8 buffer shared by the store, the corpus index and the session
+        chunks = ChunkStore.from_chunks(result["chunks"])
+        
+        # Persist so the next upload of the same PDF skips straight to READY
+        vectors = embedder.embeddings
+        try:
+            await asyncio.to_thread(
+                index_store.save,
+                session["content_key"],
+                chunks,
+                embedder.embeddings,
+                None,
+                {"filename": filename, "text_length": result["text_length"], "page_count": result["page_count"],
+                 "chunk_pages": result["chunk_pages"]},
+            )
+            # Serve from the mapped copy so compressed indexes rerank from disk, not RAM
+            stored_vectors = await asyncio.to_thread(index_store.load_vectors, session["content_key"])
+            if stored_vectors is not None:
+                vectors = stored_vectors
+        except Exception as store_error:
+            print(f"Could not persist index for {filename}: {store_error}")
         
-        # Step 3: Build index
-        session["status"] = ProcessingStatus.INDEXING
-        session["progress"] = 70
-        retriever = OptimizedEmbedder()
-        await asyncio.to_thread(retriever.build_index, chunks)
+        # Session may have been deleted while we were ingesting
+        if cancel.is_set():
+            return
+        await asyncio.to_thread(corpus_index.add_document, session_id, chunks, vectors,
+                                result["chunk_pages"])
+        if cancel.is_set():
+            corpus_index.remove_document(session_id)
+            return
+        retriever = make_retriever(session_id)
         
         # Step 4: Complete
         session.update({
@@ -169,10 +457,18 @@ async def process_pdf_background(session_id: str, tmp_path: str, filename: str):
             "retriever": retriever,
             "chunks": chunks,
             "chunks_count": len(chunks),
-            "text_length": len(pdf_text)
+            "document_stats": chunks.stats(),
+            "text_length": result["text_length"],
+            "page_count": result["page_count"],
+            "embedding_cache": embedder.cache_stats()
         })
+        pdf_sessions.account(session_id)
         
+    except IngestionCancelled:
+        print(f"Ingestion of {filename} cancelled")
     except Exception as e:
+        if session_id not in pdf_sessions:
+            return
         pdf_sessions[session_id].update({
             "status": ProcessingStatus.ERROR,
             "error": str(e)
@@ -196,13 +492,18 @@ async def get_status(session_id: str):
         "progress": session["progress"],
         "filename": session.get("filename"),
         "chunks_count": session.get("chunks_count", 0),
+        "priority": session.get("priority"),
+        "queue_position": ingest_scheduler.position(session_id),
+        "upload": session.get("upload"),
+        "pipeline": session.get("pipeline"),
+        "embedding_cache": session.get("embedding_cache"),
         "error": session.get("error")
     }
 
 # ========= STEP 2: Chat with PDF =========
 @app.post("/chat/{session_id}")
-async def chat_pdf(session_id: str, question: str = Form(...)):
-    """Chat with processed PDF"""
+async def chat_pdf(session_id: str, question: str = Form(...), mode: str = Form(DEFAULT_RETRIEVAL_MODE)):
+    """Chat with processed PDF; mode is auto, hybrid, vector or lexical retrieval"""
     if session_id not in pdf_sessions:
         return JSONResponse(status_code=404, content={"error": "Session not found"})
     
@@ -211,12 +512,16 @@ async def chat_pdf(session_id: str, question: str = Form(...)):
         return JSONResponse(status_code=400, content={
             "error": f"PDF not ready. Status: {session['status']}"
         })
+    if mode not in RETRIEVAL_MODES:
+        return JSONResponse(status_code=400, content={"error": f"Unknown retrieval mode: {mode}"})
 
     try:
+        await pdf_sessions.ensure_resident(session_id)
         retriever = session["retriever"]
-        answer = await asyncio.to_thread(generate_answer_from_context, question, retriever)
+        pages = []
+        answer = await generate_answer_from_context(question, retriever, mode=mode, cited_pages=pages)
         
-        return {"question": question, "answer": answer}
+        return {"question": question, "answer": answer, "pages": pages}
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
 
@@ -234,16 +539,19 @@ async def summarize_pdf_endpoint(session_id: str):
         })
 
     try:
+        await pdf_sessions.ensure_resident(session_id)
         chunks = session["chunks"]
         
-        # Generate summary using hierarchical approach
-        chunk_summaries = await asyncio.to_thread(summarize_chunks_batch, chunks)
-        final_summary = await asyncio.to_thread(create_final_summary, chunk_summaries)
+        # Map-reduce over every chunk, map calls run concurrently
+        summarizer = MapReduceSummarizer()
+        final_summary = await summarizer.summarize(chunks)
         
         return {
             "summary": final_summary,
             "word_count": len(final_summary.split()),
-            "sections_processed": len(chunk_summaries)
+            "sections_processed": len(summarizer.map_summaries),
+            "chunks_covered": len(chunks),
+            "levels": summarizer.level_timings
         }
         
     except Exception as e:
@@ -263,33 +571,133 @@ async def faq_pdf(session_id: str, num_questions: int = Form(5)):
         })
 
     try:
+        await pdf_sessions.ensure_resident(session_id)
         chunks = session["chunks"]
-        faq_text = await asyncio.to_thread(
-            generate_faqs_from_chunks, 
-            chunks, 
-            min(num_questions, 5)
-        )
+        faq_text = await generate_faqs_from_chunks(chunks, min(num_questions, 5))
         
         return {"faq": faq_text}
         
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
 
+# ========= Streaming variants =========
+@app.post("/chat/{session_id}/stream")
+async def chat_pdf_stream(session_id: str, question: str = Form(...), mode: str = Form(DEFAULT_RETRIEVAL_MODE)):
+    """Chat with processed PDF, streaming tokens as Server-Sent Events"""
+    started = time.perf_counter()
+    session, error = await get_ready_session(session_id)
+    if error:
+        return error
+    if mode not in RETRIEVAL_MODES:
+        return JSONResponse(status_code=400, content={"error": f"Unknown retrieval mode: {mode}"})
+    
+    # Retrieval finishes before the first byte is sent
+    pages = []
+    prompt = await build_answer_prompt(question, session["retriever"], mode=mode, cited_pages=pages)
+    if prompt is None:
+        async def no_context():
+            yield sse_event("token", {"token": NO_CONTEXT_ANSWER})
+            yield sse_event("done", {"ttft_seconds": round(time.perf_counter() - started, 3)})
+        return sse_response(no_context())
+    
+    return sse_response(stream_llm_events("chat", prompt, started, time.perf_counter() - started,
+                                          {"pages": pages}))
+
+@app.post("/summarize/{session_id}/stream")
+async def summarize_pdf_stream(session_id: str):
+    """Map-reduce summary; the final summarization call is streamed"""
+    started = time.perf_counter()
+    session, error = await get_ready_session(session_id)
+    if error:
+        return error
+    
+    try:
+        summarizer = MapReduceSummarizer()
+        prompt = await summarizer.prepare_final_prompt(session["chunks"])
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
+    
+    return sse_response(stream_llm_events("summarize", prompt, started, time.perf_counter() - started))
+
+@app.post("/faq/{session_id}/stream")
+async def faq_pdf_stream(session_id: str, num_questions: int = Form(5)):
+    """Generate FAQs, streaming tokens as Server-Sent Events"""
+    started = time.perf_counter()
+    session, error = await get_ready_session(session_id)
+    if error:
+        return error
+    
+    prompt = build_faq_prompt(session["chunks"], min(num_questions, 5))
+    return sse_response(stream_llm_events("faq", prompt, started, time.perf_counter() - started))
+
+@app.get("/stream_stats")
+async def get_stream_stats():
+    """Time-to-first-token and generation time of recent streamed responses"""
+    stats = {}
+    for endpoint, timings in stream_timings.items():
+        ttfts = [t["ttft_seconds"] for t in timings]
+        totals = [t["total_seconds"] for t in timings]
+        stats[endpoint] = {
+            "count": len(timings),
+            "avg_ttft_seconds": round(sum(ttfts) / len(ttfts), 3),
+            "avg_total_seconds": round(sum(totals) / len(totals), 3),
+            "last": timings[-1],
+        }
+    return stats
+
+# ========= Library Search =========
+@app.post("/search")
+async def search_library(question: str = Form(...), session_ids: str = Form(""), top_k: int = Form(5)):
+    """Search across documents: the comma-separated session_ids, or every READY document"""
+    if session_ids.strip():
+        requested = {sid.strip() for sid in session_ids.split(",") if sid.strip()}
+    else:
+        requested = None
+    doc_ids = [
+        sid for sid, s in pdf_sessions.items()
+        if s["status"] == ProcessingStatus.READY and (requested is None or sid in requested)
+    ]
+    if not doc_ids:
+        return {"question": question, "results": []}
+    
+    # Spilled sessions are reloaded only when explicitly named
+    if requested is not None:
+        for doc_id in doc_ids:
+            await pdf_sessions.ensure_resident(doc_id)
+    
+    hits = await asyncio.to_thread(query_batcher.search, question, top_k, doc_ids)
+    return {
+        "question": question,
+        "results": [
+            {
+                "session_id": doc_id,
+                "filename": pdf_sessions.get(doc_id, {}).get("filename"),
+                "chunk_index": chunk_idx,
+                "score": round(score, 4),
+                "text": corpus_index.document_chunks(doc_id)[chunk_idx]
+            }
+            for doc_id, chunk_idx, score in hits
+        ]
+    }
+
 # ========= Health Check =========
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    try:
-        # Quick test of Ollama connection
-        test_response = query_llm("Hello", model="llama3")
-        ollama_status = "healthy" if "Error" not in test_response else "unhealthy"
-    except:
-        ollama_status = "unhealthy"
-    
+    # Last background probe of each Ollama backend, so liveness checks cost no LLM call
+    llm_backends = llm_pool.stats()
+    ollama_status = "healthy" if llm_backends["available"] else "unhealthy"
+
     return {
         "status": "healthy",
         "ollama": ollama_status,
-        "active_sessions": len(pdf_sessions)
+        "llm_backends": llm_backends,
+        "active_sessions": len(pdf_sessions),
+        "embedding_models": model_registry.stats(),
+        "corpus_index": corpus_index.stats(),
+        "query_batcher": query_batcher.stats(),
+        "ingest_scheduler": ingest_scheduler.stats(),
+        "llm_cache": llm_cache.stats()
     }
 
 # ========= Document Statistics =========
@@ -305,21 +713,21 @@ async def get_document_stats(session_id: str):
             "error": f"PDF not ready. Status: {session['status']}"
         })
 
-    chunks = session.get("chunks", [])
-    text_length = session.get("text_length", 0)
-    
-    # Calculate statistics
-    avg_chunk_size = sum(len(chunk) for chunk in chunks) / len(chunks) if chunks else 0
-    total_words = sum(len(chunk.split()) for chunk in chunks)
+    # Counted once at ingest, so spilled sessions need not be loaded
+    stats = session.get("document_stats")
+    if stats is None:
+        await pdf_sessions.ensure_resident(session_id)
+        stats = session["chunks"].stats()
     
     return {
         "filename": session.get("filename"),
-        "total_text_length": text_length,
-        "total_chunks": len(chunks),
-        "total_words": total_words,
-        "average_chunk_size": int(avg_chunk_size),
-        "estimated_pages": len(chunks) // 3,  # Rough estimate
-        "processing_coverage": "Full document" if len(chunks) > 20 else f"First {len(chunks)} chunks only"
+        "total_text_length": session.get("text_length", 0),
+        "total_chunks": stats["total_chunks"],
+        "total_words": stats["total_words"],
+        "average_chunk_size": stats["average_chunk_size"],
+        "page_count": session.get("page_count"),
+        "estimated_pages": session.get("page_count") or stats["total_chunks"] // 3,
+        "processing_coverage": "Full document"
     }
 @app.get("/debug/{session_id}")
 async def debug_session(session_id: str):
@@ -336,16 +744,50 @@ async def debug_session(session_id: str):
         "error": session.get("error"),
         "has_retriever": session.get("retriever") is not None,
         "has_chunks": session.get("chunks") is not None,
-        "chunks_count": len(session["chunks"]) if session.get("chunks") else 0,
-        "text_length": session.get("text_length", 0)
+        "chunks_count": session.get("chunks_count", 0),
+        "document_stats": session.get("document_stats"),
+        "text_length": session.get("text_length", 0),
+        "spilled": session.get("spilled", False),
+        "memory_bytes": session.get("memory_bytes", 0)
     }
     
     # If there are chunks, show first chunk preview
     if session.get("chunks"):
-        debug_info["first_chunk_preview"] = session["chunks"][0][:200] + "..." if len(session["chunks"][0]) > 200 else session["chunks"][0]
+        first_chunk = session["chunks"][0]
+        debug_info["first_chunk_preview"] = first_chunk[:200] + "..." if len(first_chunk) > 200 else first_chunk
+        debug_info["chunk_store_bytes"] = session["chunks"].memory_bytes()
     
     return debug_info
 
+@app.get("/index_report/{session_id}")
+async def index_report(session_id: str, k: int = 5):
+    """Recall-vs-latency of ANN index settings, and memory-vs-recall of vector compression"""
+    session, error = await get_ready_session(session_id)
+    if error:
+        return error
+    
+    retriever = session["retriever"]
+    report = await asyncio.to_thread(retriever.recall_report, k)
+    compression = await asyncio.to_thread(retriever.compression_report, k)
+    return {
+        "index_kind": retriever.index_kind,
+        "vector_compression": corpus_index.compression,
+        "report": report,
+        "compression_report": compression,
+    }
+
+# ========= Observability =========
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint for this worker"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/traces")
+async def traces(limit: int = 20, min_ms: float = 0.0):
+    """Most recent request traces with their stage spans, slowest requests filterable by min_ms"""
+    matching = [t for t in reversed(recent_traces) if t["duration_ms"] >= min_ms]
+    return {"traces": matching[:limit]}
+
 # ========= Root route =========
 @app.get("/")
 async def root():
@@ -363,14 +805,19 @@ async def root():
             "status": "/status/{session_id}",
             "chat": "/chat/{session_id}", 
             "summarize": "/summarize/{session_id}",
-            "faq": "/faq/{session_id}"
+            "faq": "/faq/{session_id}",
+            "chat_stream": "/chat/{session_id}/stream",
+            "summarize_stream": "/summarize/{session_id}/stream",
+            "faq_stream": "/faq/{session_id}/stream",
+            "metrics": "/metrics",
+            "traces": "/traces"
         }
     }
 
 # ========= Session Management =========
 @app.delete("/session/{session_id}")
 async def delete_session(session_id: str):
-    """Clean up session data"""
+    """Clean up session data, stopping its ingestion if still queued or running"""
     if session_id in pdf_sessions:
         del pdf_sessions[session_id]
         return {"message": "Session deleted"}
@@ -379,13 +826,18 @@ async def delete_session(session_id: str):
 @app.get("/sessions")
 async def list_sessions():
     """List all active sessions (for debugging)"""
+    now = time.time()
     return {
         "active_sessions": len(pdf_sessions),
+        "memory": pdf_sessions.stats(),
         "sessions": {
             sid: {
                 "status": session["status"],
                 "filename": session.get("filename"),
-                "progress": session["progress"]
+                "progress": session["progress"],
+                "memory_mb": round(session.get("memory_bytes", 0) / (1024 * 1024), 2),
+                "spilled": session.get("spilled", False),
+                "idle_seconds": int(now - session.get("last_access", now))
             }
             for sid, session in pdf_sessions.items()
         }
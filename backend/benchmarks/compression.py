@@ -0,0 +1,80 @@
+"""Memory saved against recall@k for each vector compression setting.
+
+Run from backend/:
+
+    python -m benchmarks.compression                   # synthetic 200-page document, stub model
+    python -m benchmarks.compression --pages 400 --k 10
+    python -m benchmarks.compression --real-model      # embed with the configured sentence-transformer
+
+Chunks of a synthetic PDF are embedded and indexed once per setting: full
+float32, float16, int8 scalar quantization and product quantization, each
+searched with and without reranking against the full vectors. Recall@k is
+measured against exact search, with held-out chunks as queries.
+"""
+import argparse
+import contextlib
+import io
+import json
+import sys
+import tempfile
+
+import numpy as np
+
+from benchmarks.stubs import install_stub_model
+from benchmarks.synthetic_pdf import generate_pdf
+
+
+def run(pages: int, k: int, queries: int, rerank_factors, real_model: bool):
+    if not real_model:
+        install_stub_model()
+    from ann_index import IndexConfig, compression_report
+    from embedder import OptimizedEmbedder
+    from parser import parse_pdf, smart_chunk_text
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = generate_pdf(f"{workdir}/compression.pdf", pages, seed=pages)
+        with contextlib.redirect_stdout(io.StringIO()):
+            chunks = smart_chunk_text(parse_pdf(path))
+            embedder = OptimizedEmbedder(use_cache=False, index_vectors=False)
+            embedder.build_index(chunks)
+
+    vectors = embedder.embeddings
+    rng = np.random.default_rng(0)
+    held_out = np.zeros(len(vectors), dtype=bool)
+    held_out[rng.choice(len(vectors), min(queries, len(vectors) // 5), replace=False)] = True
+    return compression_report(vectors[~held_out], vectors[held_out], IndexConfig(), k=k,
+                              rerank_factors=rerank_factors)
+
+
+def print_report(report) -> None:
+    print(f"\n{report['vectors']} vectors, {report['queries']} queries, recall@{report['k']}\n")
+    print(f"  {'compression':<13}{'index MB':>10}{'saved':>8}{'rerank':>8}{'recall':>9}{'ms/query':>10}")
+    for s in report["settings"]:
+        if "skipped" in s:
+            print(f"  {s['compression']:<13}{s['index_mb']:>10}{s['memory_saved']:>8.0%}  ({s['skipped']})")
+            continue
+        print(f"  {s['compression']:<13}{s['index_mb']:>10}{s['memory_saved']:>8.0%}{s['rerank_factor']:>7}x"
+              f"{s['recall_at_k']:>9.3f}{s.get('ms_per_query', '-'):>10}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--rerank-factors", default="1,4", help="comma-separated candidate multipliers")
+    parser.add_argument("--real-model", action="store_true", help="use the real embedding model instead of the stub")
+    parser.add_argument("--output", help="also write the report as JSON here")
+    args = parser.parse_args(argv)
+
+    report = run(args.pages, args.k, args.queries,
+                 [int(f) for f in args.rerank_factors.split(",")], args.real_model)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""Local stand-in for Ollama's /api/generate, for load tests without a GPU.
+
+    python -m benchmarks.fake_ollama --port 11435 --latency-ms 200 --tokens-per-second 40
+
+then start the API with OLLAMA_API_URL=http://127.0.0.1:11435/api/generate, or
+run several on different ports and list them all in OLLAMA_API_URLS.
+Answers are canned text whose length follows the requested token count, and a
+fraction of requests can be made to fail with --error-rate.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Any, AsyncIterator, Dict
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+FILLER = ("The document describes the system in detail and the answer follows "
+          "from the relevant sections of the provided context").split()
+
+
+class FakeOllamaConfig:
+    def __init__(self, latency_ms: float = 200.0, tokens_per_second: float = 40.0,
+                 response_tokens: int = 64, error_rate: float = 0.0,
+                 error_status: int = 500, seed: int = 0):
+        # Time to first token, like prompt evaluation on a real model
+        self.latency_ms = latency_ms
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.rng = random.Random(seed)
+
+
+def create_app(config: FakeOllamaConfig) -> FastAPI:
+    app = FastAPI(title="Fake Ollama")
+    counters = {"requests": 0, "streams": 0, "errors": 0, "in_flight": 0, "max_in_flight": 0}
+
+    def final_message(prompt: str, tokens: int, started: float) -> Dict[str, Any]:
+        return {
+            "done": True,
+            "prompt_eval_count": len(prompt.split()),
+            "eval_count": tokens,
+            "total_duration": int((time.perf_counter() - started) * 1e9),
+        }
+
+    async def stream_tokens(prompt: str, model: str, started: float) -> AsyncIterator[bytes]:
+        try:
+            await asyncio.sleep(config.latency_ms / 1000)
+            for i in range(config.response_tokens):
+                token = FILLER[i % len(FILLER)] + " "
+                yield (json.dumps({"model": model, "response": token, "done": False}) + "\n").encode()
+                await asyncio.sleep(1 / config.tokens_per_second)
+            message = {"model": model, "response": "", **final_message(prompt, config.response_tokens, started)}
+            yield (json.dumps(message) + "\n").encode()
+        finally:
+            counters["in_flight"] -= 1
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        body = await request.json()
+        prompt = body.get("prompt", "")
+        model = body.get("model", "llama3")
+        started = time.perf_counter()
+        counters["requests"] += 1
+
+        if config.rng.random() < config.error_rate:
+            counters["errors"] += 1
+            return JSONResponse(status_code=config.error_status, content={"error": "injected failure"})
+
+        counters["in_flight"] += 1
+        counters["max_in_flight"] = max(counters["max_in_flight"], counters["in_flight"])
+        if body.get("stream", True):
+            counters["streams"] += 1
+            return StreamingResponse(stream_tokens(prompt, model, started), media_type="application/x-ndjson")
+
+        try:
+            await asyncio.sleep(config.latency_ms / 1000 + config.response_tokens / config.tokens_per_second)
+        finally:
+            counters["in_flight"] -= 1
+        text = " ".join(FILLER[i % len(FILLER)] for i in range(config.response_tokens))
+        return {"model": model, "response": text, **final_message(prompt, config.response_tokens, started)}
+
+    @app.get("/api/tags")
+    async def tags():
+        return {"models": [{"name": "llama3"}]}
+
+    @app.get("/stats")
+    async def stats():
+        return counters
+
+    return app
+
+
+def main(argv=None) -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=40.0)
+    parser.add_argument("--response-tokens", type=int, default=64)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=500)
+    args = parser.parse_args(argv)
+
+    config = FakeOllamaConfig(args.latency_ms, args.tokens_per_second, args.response_tokens,
+                              args.error_rate, args.error_status)
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""Concurrent load generator for the chat, summarize and FAQ endpoints.
+
+Against an already running API:
+
+    python -m benchmarks.load_test --base-url http://127.0.0.1:8000 --concurrency 32
+
+or let the harness start a fake Ollama and the API (uvicorn) itself:
+
+    python -m benchmarks.load_test --spawn --workers 2 --latency-ms 300 --tokens-per-second 30
+
+--ollama-backends N spawns N fake Ollama servers behind the API's backend
+pool; --failing-backends K makes the last K of them fail every generate
+call, to exercise the circuit breaker. Spawned APIs run with the LLM
+response cache off, so every request reaches the fake Ollama, and with
+more than one worker they share sessions through SQLite in a scratch
+directory.
+
+Synthetic PDFs are uploaded first; then --concurrency clients send --requests
+requests picked from --mix. Reports p50/p95/p99 latency and requests per
+second per endpoint; streaming endpoints also report time to first byte.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+import numpy as np
+
+from benchmarks.synthetic_pdf import VOCABULARY, generate_pdf
+from llm_cache import ERROR_PREFIX
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MIX = "chat=6,chat_stream=2,summarize=1,faq=1"
+
+ENDPOINTS = {
+    "chat": ("/chat/{sid}", False),
+    "chat_stream": ("/chat/{sid}/stream", True),
+    "summarize": ("/summarize/{sid}", False),
+    "summarize_stream": ("/summarize/{sid}/stream", True),
+    "faq": ("/faq/{sid}", False),
+    "faq_stream": ("/faq/{sid}/stream", True),
+}
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ENDPOINTS:
+            raise SystemExit(f"Unknown endpoint '{name}' in --mix (choose from {', '.join(ENDPOINTS)})")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.first_byte: List[float] = []
+        self.errors = 0
+
+    def summary(self, wall_seconds: float) -> Dict[str, Any]:
+        ok = np.array(self.latencies) * 1000
+        result: Dict[str, Any] = {
+            "requests": len(self.latencies) + self.errors,
+            "errors": self.errors,
+            "rps": round(len(self.latencies) / wall_seconds, 2) if wall_seconds else 0.0,
+        }
+        if len(ok):
+            p50, p95, p99 = np.percentile(ok, [50, 95, 99])
+            result.update({"p50_ms": round(p50, 1), "p95_ms": round(p95, 1), "p99_ms": round(p99, 1)})
+        if self.first_byte:
+            result["ttfb_p50_ms"] = round(float(np.percentile(np.array(self.first_byte) * 1000, 50)), 1)
+        return result
+
+
+async def upload_documents(client: httpx.AsyncClient, count: int, pages: int, workdir: str) -> List[str]:
+    session_ids = []
+    for i in range(count):
+        path = generate_pdf(os.path.join(workdir, f"load_{i}.pdf"), pages, seed=1000 + i)
+        with open(path, "rb") as f:
+            response = await client.post("/upload_pdf/", files={"file": (f"load_{i}.pdf", f, "application/pdf")})
+        response.raise_for_status()
+        session_ids.append(response.json()["session_id"])
+
+    for session_id in session_ids:
+        while True:
+            status = (await client.get(f"/status/{session_id}")).json()
+            if status["status"] == "ready":
+                break
+            if status["status"] == "error":
+                raise RuntimeError(f"Upload {session_id} failed: {status.get('error')}")
+            await asyncio.sleep(0.2)
+    return session_ids
+
+
+async def send(client: httpx.AsyncClient, endpoint: str, session_id: str,
+               rng: random.Random, stats: EndpointStats) -> None:
+    path, streaming = ENDPOINTS[endpoint]
+    data = {}
+    if endpoint.startswith("chat"):
+        data["question"] = " ".join(rng.choice(VOCABULARY) for _ in range(6)) + "?"
+
+    started = time.perf_counter()
+    try:
+        if streaming:
+            async with client.stream("POST", path.format(sid=session_id), data=data) as response:
+                first_byte = None
+                body = []
+                async for chunk in response.aiter_text():
+                    if first_byte is None:
+                        first_byte = time.perf_counter() - started
+                    body.append(chunk)
+            failed = response.status_code != 200 or "event: error" in "".join(body)
+        else:
+            response = await client.post(path.format(sid=session_id), data=data)
+            payload = response.json() if response.status_code == 200 else {}
+            answer = next((v for v in payload.values() if isinstance(v, str) and v.startswith(ERROR_PREFIX)), None)
+            failed = response.status_code != 200 or answer is not None
+    except httpx.HTTPError:
+        failed = True
+
+    if failed:
+        stats.errors += 1
+        return
+    stats.latencies.append(time.perf_counter() - started)
+    if streaming and first_byte is not None:
+        stats.first_byte.append(first_byte)
+
+
+async def run_load(base_url: str, documents: int, pages: int, concurrency: int,
+                   total_requests: int, mix: Dict[str, float], seed: int = 0) -> Dict[str, Any]:
+    timeout = httpx.Timeout(300.0, connect=10.0)
+    limits = httpx.Limits(max_connections=concurrency + 4, max_keepalive_connections=concurrency + 4)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        with tempfile.TemporaryDirectory() as workdir:
+            upload_started = time.perf_counter()
+            session_ids = await upload_documents(client, documents, pages, workdir)
+            upload_seconds = time.perf_counter() - upload_started
+
+        rng = random.Random(seed)
+        names, weights = list(mix), list(mix.values())
+        plan = [(rng.choices(names, weights)[0], rng.choice(session_ids)) for _ in range(total_requests)]
+        stats = {name: EndpointStats() for name in names}
+        next_request = iter(plan)
+
+        async def client_loop(worker: int):
+            worker_rng = random.Random(seed + worker)
+            for endpoint, session_id in next_request:
+                await send(client, endpoint, session_id, worker_rng, stats[endpoint])
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(i) for i in range(concurrency)))
+        wall_seconds = time.perf_counter() - started
+
+    endpoints = {name: s.summary(wall_seconds) for name, s in stats.items()}
+    completed = sum(len(s.latencies) for s in stats.values())
+    return {
+        "documents": documents,
+        "pages": pages,
+        "upload_seconds": round(upload_seconds, 2),
+        "concurrency": concurrency,
+        "wall_seconds": round(wall_seconds, 2),
+        "total_rps": round(completed / wall_seconds, 2) if wall_seconds else 0.0,
+        "endpoints": endpoints,
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"\n{report['documents']} documents x {report['pages']} pages uploaded in {report['upload_seconds']}s")
+    print(f"{report['concurrency']} concurrent clients, {report['wall_seconds']}s, {report['total_rps']} req/s overall\n")
+    print(f"  {'endpoint':<18}{'reqs':>6}{'errors':>8}{'rps':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ttfb p50':>10}")
+    for name, s in report["endpoints"].items():
+        print(f"  {name:<18}{s['requests']:>6}{s['errors']:>8}{s['rps']:>8}"
+              f"{s.get('p50_ms', '-'):>10}{s.get('p95_ms', '-'):>10}{s.get('p99_ms', '-'):>10}"
+              f"{s.get('ttfb_p50_ms', '-'):>10}")
+
+
+def wait_until_up(url: str, process: subprocess.Popen, timeout: float = 120.0) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with status {process.returncode}")
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.25)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+def spawn_servers(args, workdir: str) -> List[subprocess.Popen]:
+    """Start the fake Ollama backends and the API as uvicorn subprocesses."""
+    ports = [args.ollama_port + i for i in range(args.ollama_backends)]
+    fakes = []
+    for i, port in enumerate(ports):
+        failing = i >= args.ollama_backends - args.failing_backends
+        fakes.append(subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.fake_ollama", "--port", str(port),
+             "--latency-ms", str(args.latency_ms), "--tokens-per-second", str(args.tokens_per_second),
+             "--response-tokens", str(args.response_tokens),
+             "--error-rate", "1.0" if failing else str(args.error_rate)],
+            cwd=BACKEND_DIR,
+        ))
+    urls = ",".join(f"http://127.0.0.1:{port}/api/generate" for port in ports)
+    env = dict(os.environ, OLLAMA_API_URLS=urls, LLM_CACHE_ENABLED="0")
+    if args.workers > 1:
+        # In-memory sessions are per process: another worker would 404 them
+        env.update(SESSION_BACKEND="sqlite",
+                   SESSION_DB_PATH=os.path.join(workdir, "sessions.sqlite3"),
+                   PDF_INDEX_STORE_DIR=os.path.join(workdir, "index_store"))
+    api = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(args.api_port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )
+    processes = fakes + [api]
+    try:
+        for port, fake in zip(ports, fakes):
+            wait_until_up(f"http://127.0.0.1:{port}/api/tags", fake)
+        wait_until_up(f"http://127.0.0.1:{args.api_port}/", api)
+    except Exception:
+        stop_servers(processes)
+        raise
+    return processes
+
+
+def stop_servers(processes: List[subprocess.Popen]) -> None:
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--documents", type=int, default=2)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="total requests to send")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="endpoint=weight pairs")
+    parser.add_argument("--output", help="also write the report as JSON here")
+    spawn = parser.add_argument_group("spawned servers")
+    spawn.add_argument("--spawn", action="store_true", help="start a fake Ollama and the API first")
+    spawn.add_argument("--workers", type=int, default=1, help="uvicorn workers for the API")
+    spawn.add_argument("--api-port", type=int, default=8765)
+    spawn.add_argument("--ollama-port", type=int, default=11435, help="first fake Ollama port")
+    spawn.add_argument("--ollama-backends", type=int, default=1, help="fake Ollama servers to start")
+    spawn.add_argument("--failing-backends", type=int, default=0, help="of those, how many fail every call")
+    spawn.add_argument("--latency-ms", type=float, default=200.0)
+    spawn.add_argument("--tokens-per-second", type=float, default=40.0)
+    spawn.add_argument("--response-tokens", type=int, default=64)
+    spawn.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    processes: Optional[List[subprocess.Popen]] = None
+    base_url = args.base_url
+    with tempfile.TemporaryDirectory() as workdir:
+        if args.spawn:
+            processes = spawn_servers(args, workdir)
+            base_url = f"http://127.0.0.1:{args.api_port}"
+        try:
+            report = asyncio.run(run_load(base_url, args.documents, args.pages, args.concurrency,
+                                          args.requests, parse_mix(args.mix)))
+        finally:
+            if processes:
+                stop_servers(processes)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,243 @@
+"""Offline benchmarks for the ingestion and retrieval hot paths.
+
+Run from backend/:
+
+    python -m benchmarks.run                       # compare against baseline.json
+    python -m benchmarks.run --pages 20,100,400    # custom document sizes
+    python -m benchmarks.run --save-baseline       # record a new baseline
+
+Uses synthetic PDFs, a hashed bag-of-words stub in place of the embedding
+model and a stub LLM, so no network or model download is needed. Exits with
+status 1 when any timing is slower than the baseline by more than --tolerance,
+or when a correctness check on the same paths fails. Timings are only compared
+with at least three repeats; a single run is too noisy to flag.
+
+Timings only compare on the machine that recorded them: the committed
+baseline.json comes from a 1-CPU Linux container. Record your own with
+--save-baseline on an unchanged tree before comparing a change, and refresh
+the committed one whenever a change moves the measured paths.
+"""
+import argparse
+import asyncio
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+from benchmarks.stubs import install_stub_model, make_stub_llm
+from benchmarks.synthetic_pdf import VOCABULARY, generate_pdf
+
+# Installed before the modules below first ask the registry for a model
+install_stub_model()
+
+from context_builder import CONTEXT_TOKEN_BUDGET, build_context
+from embedder import OptimizedEmbedder
+from parser import chunk_spans, parse_pdf, smart_chunk_text
+from summarizer import MapReduceSummarizer
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+DEFAULT_PAGES = (10, 50, 200)
+DEFAULT_REPEAT = 3
+DEFAULT_TOLERANCE = 0.25
+# Shorter timings are mostly scheduler noise; they are reported but never flagged
+MIN_COMPARABLE_SECONDS = 0.005
+# A best-of-fewer-runs timing swings too much to compare against the baseline
+MIN_COMPARABLE_REPEAT = 3
+QUERY_COUNT = 200
+CHUNK_SIZE = 1200
+CHUNK_OVERLAP = 200
+
+
+def measure(fn: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    """Best-of-repeat wall time, then one extra traced run for peak Python heap.
+
+    The code under test logs with print(); that output is discarded.
+    """
+    best = float("inf")
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            gc.collect()
+            started = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - started)
+
+        gc.collect()
+        tracemalloc.start()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {"seconds": round(best, 5), "peak_mb": round(peak / (1024 * 1024), 2)}
+
+
+def run_document(pages: int, words_per_page: int, scanned_ratio: float,
+                 repeat: int, workdir: str) -> Dict[str, Dict[str, Any]]:
+    """Time every hot path on one synthetic document."""
+    pdf_path = generate_pdf(os.path.join(workdir, f"synthetic_{pages}.pdf"), pages,
+                            words_per_page=words_per_page, scanned_ratio=scanned_ratio, seed=pages)
+    pdf_mb = os.path.getsize(pdf_path) / (1024 * 1024)
+    results: Dict[str, Dict[str, Any]] = {}
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        text = parse_pdf(pdf_path)
+    result = measure(lambda: parse_pdf(pdf_path), repeat)
+    result["throughput"] = f"{pages / result['seconds']:.1f} pages/s"
+    results["parse_pdf"] = result
+
+    text_mb = len(text) / (1024 * 1024)
+    chunks = smart_chunk_text(text, CHUNK_SIZE, CHUNK_OVERLAP)
+    result = measure(lambda: smart_chunk_text(text, CHUNK_SIZE, CHUNK_OVERLAP), repeat)
+    result["throughput"] = f"{text_mb / result['seconds']:.2f} MB/s"
+    results["smart_chunk_text"] = result
+
+    # Offsets only, no chunk strings
+    result = measure(lambda: chunk_spans(text, CHUNK_SIZE, CHUNK_OVERLAP), repeat)
+    result["throughput"] = f"{text_mb / result['seconds']:.2f} MB/s"
+    results["chunk_spans"] = result
+
+    embedder = OptimizedEmbedder(use_cache=False)
+    result = measure(lambda: embedder.build_index(chunks), repeat)
+    result["throughput"] = f"{len(chunks) / result['seconds']:.0f} chunks/s"
+    results["build_index"] = result
+
+    rng = random.Random(0)
+    questions = [" ".join(rng.choice(VOCABULARY) for _ in range(5)) + "?" for _ in range(QUERY_COUNT)]
+    for mode in ("vector", "lexical", "hybrid"):
+        result = measure(lambda: [embedder.query(q, top_k=5, mode=mode) for q in questions], repeat)
+        result["throughput"] = f"{QUERY_COUNT / result['seconds']:.0f} queries/s"
+        results[f"query_{mode}"] = result
+
+    summarizer = MapReduceSummarizer(llm=make_stub_llm())
+    result = measure(lambda: asyncio.run(summarizer.summarize(chunks)), repeat)
+    result["throughput"] = f"{len(chunks) / result['seconds']:.0f} chunks/s"
+    results["map_reduce_summary"] = result
+
+    return {
+        "document": {"pages": pages, "pdf_mb": round(pdf_mb, 2),
+                     "text_mb": round(text_mb, 2), "chunks": len(chunks)},
+        "benchmarks": results,
+    }
+
+
+def check_context_packing() -> List[str]:
+    """Adjacent hits that merge past the token budget must still put the best hit in the context."""
+    rng = random.Random(0)
+    text = "\n\n".join(" ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(40, 160))) + "."
+                        for _ in range(40))
+    chunks = smart_chunk_text(text, CHUNK_SIZE, CHUNK_OVERLAP)
+
+    def count_words(s: str) -> int:
+        return len(s.split())
+
+    failures = []
+    cases = [(top, [(i, 1.0 if i == top else 0.5) for i in range(8)], CONTEXT_TOKEN_BUDGET) for top in (0, 3, 7)]
+    # A single chunk larger than the whole budget
+    cases.append((0, [(0, 1.0)], 50))
+    for top, hits, budget in cases:
+        sources: List[int] = []
+        context = build_context(hits, chunks, budget, count_words, sources)
+        if top not in sources or not context or count_words(context) > budget:
+            failures.append(f"context packing: best hit (chunk {top} of {len(hits)}) left out "
+                            f"of a {budget}-token context")
+    return failures
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Names of timings slower than baseline * (1 + tolerance)."""
+    regressions = []
+    missing = set()
+    for doc_key, doc_results in current["results"].items():
+        previous_results = baseline.get("results", {}).get(doc_key, {}).get("benchmarks", {})
+        for name, result in doc_results["benchmarks"].items():
+            previous = previous_results.get(name)
+            if previous is None:
+                missing.add(name)
+                continue
+            ratio = result["seconds"] / previous["seconds"] if previous["seconds"] else 1.0
+            result["vs_baseline"] = round(ratio, 2)
+            if ratio > 1 + tolerance and result["seconds"] >= MIN_COMPARABLE_SECONDS:
+                regressions.append(f"{name} @ {doc_key}: {ratio:.2f}x baseline")
+    if missing:
+        print(f"Warning: not in the baseline, not compared: {', '.join(sorted(missing))}")
+    return regressions
+
+
+def print_table(current: Dict[str, Any]) -> None:
+    for doc_key, doc_results in current["results"].items():
+        doc = doc_results["document"]
+        print(f"\n{doc_key}: {doc['pdf_mb']} MB PDF, {doc['text_mb']} MB text, {doc['chunks']} chunks")
+        print(f"  {'benchmark':<24}{'seconds':>10}{'peak MB':>10}{'vs base':>9}  throughput")
+        for name, result in doc_results["benchmarks"].items():
+            ratio = f"{result['vs_baseline']:.2f}x" if "vs_baseline" in result else "-"
+            print(f"  {name:<24}{result['seconds']:>10.4f}{result['peak_mb']:>10.2f}{ratio:>9}  {result['throughput']}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", default=",".join(map(str, DEFAULT_PAGES)),
+                        help="comma-separated document sizes in pages")
+    parser.add_argument("--words-per-page", type=int, default=400, help="text density")
+    parser.add_argument("--scanned-ratio", type=float, default=0.1,
+                        help="fraction of image-only pages with no text layer")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed slowdown before a timing counts as a regression")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--output", help="also write the results as JSON here")
+    args = parser.parse_args(argv)
+
+    current = {
+        "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                    "cpus": os.cpu_count()},
+        "settings": {"words_per_page": args.words_per_page, "scanned_ratio": args.scanned_ratio,
+                     "repeat": args.repeat},
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        for pages in (int(p) for p in args.pages.split(",")):
+            current["results"][f"{pages}p"] = run_document(
+                pages, args.words_per_page, args.scanned_ratio, args.repeat, workdir)
+
+    regressions: List[str] = []
+    if args.repeat < MIN_COMPARABLE_REPEAT:
+        print(f"Warning: timings not compared against the baseline below --repeat {MIN_COMPARABLE_REPEAT}")
+    elif not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("settings") != current["settings"]:
+            print("Warning: baseline was recorded with different settings")
+        if baseline.get("machine") != current["machine"]:
+            print("Warning: baseline was recorded on a different machine; "
+                  "record a local one with --save-baseline before comparing")
+        regressions = compare(current, baseline, args.tolerance)
+    regressions.extend(check_context_packing())
+
+    print_table(current)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+
+    if regressions:
+        print("\nRegressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,57 @@
+import asyncio
+import hashlib
+import re
+from typing import Any, Dict, List
+
+import numpy as np
+
+from model_registry import DEFAULT_MODEL_NAME, model_registry
+
+STUB_DIMENSION = 384
+_WORD = re.compile(r"\w+")
+
+
+class StubTokenizer:
+    def __call__(self, text: str, add_special_tokens: bool = False, verbose: bool = False) -> Dict[str, List[str]]:
+        return {"input_ids": _WORD.findall(text)}
+
+
+class StubEmbeddingModel:
+    """Offline stand-in for SentenceTransformer: hashed bag-of-words vectors.
+
+    Similar texts get similar vectors, so retrieval results stay meaningful,
+    and the per-text cost scales with text length like a real encoder.
+    """
+
+    def __init__(self, dimension: int = STUB_DIMENSION):
+        self.dimension = dimension
+        self.tokenizer = StubTokenizer()
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def encode(self, texts: List[str], convert_to_numpy: bool = True, **kwargs: Any) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in _WORD.findall(text.lower()):
+                digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+                vectors[row, int.from_bytes(digest, "little") % self.dimension] += 1.0
+        return vectors
+
+
+def install_stub_model(model_name: str = DEFAULT_MODEL_NAME) -> StubEmbeddingModel:
+    """Register the stub under the production model name so nothing downloads."""
+    model = StubEmbeddingModel()
+    model_registry.register(model_name, model)
+    return model
+
+
+def make_stub_llm(latency_seconds: float = 0.0):
+    """Async stand-in for aquery_llm with a fixed per-call latency."""
+
+    async def stub_llm(prompt: str, model: str = "llama3") -> str:
+        if latency_seconds:
+            await asyncio.sleep(latency_seconds)
+        return f"Summary of {len(prompt)} characters."
+
+    return stub_llm
@@ -0,0 +1,56 @@
+import random
+from typing import List
+
+import fitz
+
+# Small fixed vocabulary so the lexical index sees realistic term repetition
+VOCABULARY = (
+    "system data model index query document page section result method value "
+    "analysis process report table figure memory latency throughput cache vector "
+    "search score token chunk summary policy contract revenue customer network"
+).split()
+
+PAGE_RECT = fitz.Rect(50, 50, 550, 790)
+
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(VOCABULARY) for _ in range(rng.randint(6, 18))]
+    return " ".join(words).capitalize() + "."
+
+
+def page_text(rng: random.Random, words_per_page: int) -> str:
+    """Paragraphs of random sentences, roughly words_per_page words in total."""
+    paragraphs: List[str] = []
+    words = 0
+    while words < words_per_page:
+        paragraph = " ".join(_sentence(rng) for _ in range(rng.randint(3, 8)))
+        paragraphs.append(paragraph)
+        words += len(paragraph.split())
+    return "\n\n".join(paragraphs)
+
+
+def generate_pdf(path: str, pages: int, words_per_page: int = 400,
+                 scanned_ratio: float = 0.0, seed: int = 0) -> str:
+    """Write a synthetic PDF with text pages and, optionally, scanned ones.
+
+    Scanned pages are the rendered image of a text page with no text layer,
+    like the output of a scanner, so extraction finds nothing on them.
+    """
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for page_num in range(pages):
+        page = doc.new_page()
+        text = page_text(rng, words_per_page)
+        if rng.random() < scanned_ratio:
+            scratch = fitz.open()
+            scratch_page = scratch.new_page()
+            scratch_page.insert_textbox(PAGE_RECT, text, fontsize=7)
+            pixmap = scratch_page.get_pixmap(dpi=72)
+            page.insert_image(page.rect, pixmap=pixmap)
+            scratch.close()
+        else:
+            # Dense pages may overflow the box; the overflow is simply dropped
+            page.insert_textbox(PAGE_RECT, f"Page {page_num + 1}\n\n{text}", fontsize=7)
+    doc.save(path)
+    doc.close()
+    return path
@@ -0,0 +1,84 @@
+import os
+import sys
+from typing import Any, Dict, Iterable, Iterator, Sequence, Union
+
+import numpy as np
+
+CHUNK_DATA_FILE = "chunks.bin"
+CHUNK_OFFSETS_FILE = "chunk_offsets.npy"
+CHUNK_COUNTS_FILE = "chunk_counts.npy"
+
+
+class ChunkStore(Sequence[str]):
+    """Chunks packed into one UTF-8 buffer, addressed by an offsets array.
+
+    Each chunk's character and word counts are computed once at build time,
+    so document statistics never re-read the text. Indexing decodes a single
+    chunk on demand; slicing returns a list of strings.
+    """
+
+    def __init__(self, data: bytes, offsets: np.ndarray, char_counts: np.ndarray, word_counts: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+        self.char_counts = char_counts
+        self.word_counts = word_counts
+        self.total_chars = int(char_counts.sum())
+        self.total_words = int(word_counts.sum())
+
+    @classmethod
+    def from_chunks(cls, chunks: Iterable[str]) -> "ChunkStore":
+        if isinstance(chunks, ChunkStore):
+            return chunks
+        chunks = list(chunks)
+        encoded = [chunk.encode("utf-8") for chunk in chunks]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(chunk) for chunk in encoded], out=offsets[1:])
+        char_counts = np.fromiter((len(chunk) for chunk in chunks), dtype=np.int32, count=len(chunks))
+        word_counts = np.fromiter((len(chunk.split()) for chunk in chunks), dtype=np.int32, count=len(chunks))
+        return cls(b"".join(encoded), offsets, char_counts, word_counts)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("chunk index out of range")
+        return str(memoryview(self.data)[self.offsets[index]:self.offsets[index + 1]], "utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        view = memoryview(self.data)
+        offsets = self.offsets.tolist()
+        for start, end in zip(offsets, offsets[1:]):
+            yield str(view[start:end], "utf-8")
+
+    def stats(self) -> Dict[str, Any]:
+        count = len(self)
+        return {
+            "total_chunks": count,
+            "total_words": self.total_words,
+            "total_chars": self.total_chars,
+            "average_chunk_size": self.total_chars // count if count else 0,
+        }
+
+    def memory_bytes(self) -> int:
+        return (sys.getsizeof(self.data) + self.offsets.nbytes
+                + self.char_counts.nbytes + self.word_counts.nbytes)
+
+    # ----- persistence -----
+    def save(self, directory: str) -> None:
+        with open(os.path.join(directory, CHUNK_DATA_FILE), "wb") as f:
+            f.write(self.data)
+        np.save(os.path.join(directory, CHUNK_OFFSETS_FILE), self.offsets)
+        np.save(os.path.join(directory, CHUNK_COUNTS_FILE), np.stack([self.char_counts, self.word_counts]))
+
+    @classmethod
+    def load(cls, directory: str) -> "ChunkStore":
+        with open(os.path.join(directory, CHUNK_DATA_FILE), "rb") as f:
+            data = f.read()
+        offsets = np.load(os.path.join(directory, CHUNK_OFFSETS_FILE))
+        char_counts, word_counts = np.load(os.path.join(directory, CHUNK_COUNTS_FILE))
+        return cls(data, offsets, char_counts, word_counts)
@@ -0,0 +1,172 @@
+import heapq
+import itertools
+import os
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from model_registry import get_model
+
+# Prompt budget for retrieved context, in tokens
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "768"))
+
+# smart_chunk_text carries at most this many characters from one chunk into the next
+MAX_CHUNK_OVERLAP = 400
+# Shorter suffix/prefix matches are coincidence (a shared word or full stop), not chunk overlap
+MIN_CHUNK_OVERLAP = 20
+
+_token_counter: Optional[Callable[[str], int]] = None
+
+
+def get_token_counter() -> Callable[[str], int]:
+    """Count tokens with a real tokenizer.
+
+    LLM_TOKENIZER names a Hugging Face tokenizer matching the Ollama model
+    (e.g. a local llama3 tokenizer directory). Without it, the already
+    loaded embedding model's WordPiece tokenizer stands in; its counts can
+    differ from llama3's by a wide margin either way, so a warning is printed.
+    """
+    global _token_counter
+    if _token_counter is None:
+        tokenizer_name = os.getenv("LLM_TOKENIZER")
+        if tokenizer_name:
+            from transformers import AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+        else:
+            print("WARNING: LLM_TOKENIZER is not set; the context token budget is counted with the "
+                  "embedding model's tokenizer and will not match the LLM's token counts")
+            tokenizer = get_model().tokenizer
+
+        def count_tokens(text: str) -> int:
+            return len(tokenizer(text, add_special_tokens=False, verbose=False)["input_ids"])
+
+        _token_counter = count_tokens
+    return _token_counter
+
+
+def overlap_length(left: str, right: str, max_overlap: int = MAX_CHUNK_OVERLAP,
+                   min_overlap: int = MIN_CHUNK_OVERLAP) -> int:
+    """Length of the longest suffix of left that is also a prefix of right, 0 if under min_overlap."""
+    for length in range(min(len(left), len(right), max_overlap), min_overlap - 1, -1):
+        if left.endswith(right[:length]):
+            return length
+    return 0
+
+
+def merge_adjacent(chunks: Sequence[str]) -> str:
+    """Stitch consecutive chunks back into continuous text, dropping the repeated overlap."""
+    text = chunks[0]
+    for chunk in chunks[1:]:
+        overlap = overlap_length(text, chunk)
+        if overlap:
+            text += chunk[overlap:]
+        else:
+            text += "\n\n" + chunk
+    return text
+
+
+def build_spans(hits: Sequence[Tuple[int, float]], chunks: Sequence[str]) -> List[Tuple[str, float, List[int]]]:
+    """Group hits on neighbouring chunks into single text spans scored by their best member."""
+    best = {}
+    for idx, score in hits:
+        best[idx] = max(score, best.get(idx, score))
+
+    spans = []
+    run: List[int] = []
+    for idx in sorted(best):
+        if run and idx != run[-1] + 1:
+            spans.append((merge_adjacent([chunks[i] for i in run]), max(best[i] for i in run), run))
+            run = []
+        run.append(idx)
+    if run:
+        spans.append((merge_adjacent([chunks[i] for i in run]), max(best[i] for i in run), run))
+    return spans
+
+
+def truncate_to_tokens(text: str, token_budget: int, count_tokens: Callable[[str], int]) -> str:
+    """Longest prefix of text, cut at a word boundary, that fits in token_budget."""
+    if token_budget <= 0:
+        return ""
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(text[:mid]) <= token_budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    if lo < len(text):
+        cut = text.rfind(" ", 0, lo)
+        lo = cut if cut > 0 else lo
+    return text[:lo].rstrip()
+
+
+def _fit_core(run: List[int], best: Dict[int, float], chunks: Sequence[str], token_budget: int,
+              count_tokens: Callable[[str], int]) -> Tuple[int, int]:
+    """[lo, hi) of run: its best chunk grown toward the better neighbour while the text fits."""
+    top = max(range(len(run)), key=lambda i: best[run[i]])
+    lo, hi = top, top + 1
+    while True:
+        neighbours = [i for i in (lo - 1, hi) if 0 <= i < len(run)]
+        grown = False
+        for i in sorted(neighbours, key=lambda i: best[run[i]], reverse=True):
+            new_lo, new_hi = min(lo, i), max(hi, i + 1)
+            if count_tokens(merge_adjacent([chunks[j] for j in run[new_lo:new_hi]])) <= token_budget:
+                lo, hi = new_lo, new_hi
+                grown = True
+                break
+        if not grown:
+            return lo, hi
+
+
+def build_context(
+    hits: Sequence[Tuple[int, float]],
+    chunks: Sequence[str],
+    token_budget: int = CONTEXT_TOKEN_BUDGET,
+    count_tokens: Optional[Callable[[str], int]] = None,
+    sources: Optional[List[int]] = None,
+) -> str:
+    """Fill the token budget greedily by relevance with de-duplicated text spans.
+
+    Spans that don't fit are skipped rather than ending the packing, so a
+    smaller, less relevant span can still use the remaining budget. A merged
+    run of neighbours that is over budget is split: its best chunk and as
+    many neighbours as fit go in, and the rest of the run competes again on
+    its own scores. The best hit always makes it in, truncated if it alone
+    exceeds the budget. The indices of the chunks that made it in are
+    appended to sources, if given.
+    """
+    count_tokens = count_tokens or get_token_counter()
+    separator_tokens = count_tokens("\n\n")
+    best: Dict[int, float] = {}
+    for idx, score in hits:
+        best[idx] = max(score, best.get(idx, score))
+
+    # Best first; the counter keeps equal scores in span order
+    order = itertools.count()
+    queue = [(-score, next(order), run) for _, score, run in build_spans(hits, chunks)]
+    heapq.heapify(queue)
+
+    selected = []
+    used = 0
+    while queue:
+        _, _, run = heapq.heappop(queue)
+        remaining = token_budget - used - (separator_tokens if selected else 0)
+        text = merge_adjacent([chunks[i] for i in run])
+        tokens = count_tokens(text)
+        if tokens > remaining and len(run) > 1:
+            lo, hi = _fit_core(run, best, chunks, remaining, count_tokens)
+            for part in (run[:lo], run[lo:hi], run[hi:]):
+                if part:
+                    heapq.heappush(queue, (-max(best[i] for i in part), next(order), part))
+            continue
+        if tokens > remaining:
+            if selected:
+                continue
+            text = truncate_to_tokens(text, remaining, count_tokens)
+            if not text:
+                continue
+            tokens = count_tokens(text)
+        selected.append(text)
+        used += tokens + (separator_tokens if len(selected) > 1 else 0)
+        if sources is not None:
+            sources.extend(run)
+
+    return "\n\n".join(selected)
@@ -0,0 +1,335 @@
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+from ann_index import (
+    COMPRESS_MIN_VECTORS, IndexConfig, bytes_per_vector, compression_report, new_coded_index,
+    normalize, recall_report, rerank, train_sample,
+)
+from chunk_store import ChunkStore
+from lexical_index import DEFAULT_RETRIEVAL_MODE, BM25Index, hybrid_search
+from metrics import stage_timer
+from model_registry import DEFAULT_MODEL_NAME, get_model
+
+# Vector ids are (document number << 32) | chunk number
+DOC_SHIFT = 32
+
+
+class _Document:
+    def __init__(self, doc_num: int, chunks: ChunkStore, lexical: BM25Index,
+                 pages: Optional[List[int]] = None, vectors: Optional[np.ndarray] = None):
+        self.doc_num = doc_num
+        self.chunks = chunks
+        self.lexical = lexical
+        # Page each chunk starts on; empty for entries stored before pages were tracked
+        self.pages = list(pages) if pages is not None and len(pages) == len(chunks) else []
+        # Full-precision vectors for reranking compressed results, ideally
+        # memory-mapped from the index store; None when the index stays exact
+        self.vectors = vectors
+
+    @property
+    def ids(self) -> np.ndarray:
+        return (np.int64(self.doc_num) << DOC_SHIFT) + np.arange(len(self.chunks), dtype=np.int64)
+
+
+class CorpusIndex:
+    """One shared vector index for every document, each vector tagged with its document id.
+
+    Starts as an exact flat index and migrates to a trained IVF index once it
+    grows past index_config.flat_max_vectors. With index_config.compression
+    set, it is retrained on compressed codes (fp16, int8 or PQ) once
+    compress_min_vectors exist, and results are reranked against each
+    document's full vectors. Every variant supports removal by id and
+    id-filtered search, which is how queries are scoped to documents.
+    """
+
+    def __init__(self, index_config: Optional[IndexConfig] = None):
+        self.index_config = index_config or IndexConfig()
+        self.index = None
+        self.index_kind = None
+        # Format of the vectors currently in the index
+        self.compression = "none"
+        self._docs: Dict[str, _Document] = {}
+        self._next_doc_num = 0
+        self._lock = threading.RLock()
+
+    # ----- building -----
+    def _new_flat(self, dimension: int):
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+
+    def _exact_vectors(self, doc: _Document) -> np.ndarray:
+        if doc.vectors is not None:
+            return doc.vectors
+        return self.index.reconstruct_batch(doc.ids)
+
+    def _rebuild(self, kind: str):
+        """Retrain as kind ("flat" or "ivf") in the configured compression, from exact vectors."""
+        docs = list(self._docs.values())
+        dimension = self.index.d
+        total = sum(len(doc.chunks) for doc in docs)
+        vectors = np.empty((total, dimension), dtype=np.float32)
+        ids = np.empty(total, dtype=np.int64)
+        position = 0
+        for doc in docs:
+            count = len(doc.chunks)
+            vectors[position:position + count] = self._exact_vectors(doc)
+            ids[position:position + count] = doc.ids
+            position += count
+
+        compression = self.index_config.compression
+        nlist = 1
+        if kind == "ivf":
+            nlist = self.index_config.ivf_nlist or int(4 * np.sqrt(total))
+            nlist = max(1, min(nlist, total // 39))
+
+        if compression == "none" and kind == "flat":
+            index = self._new_flat(dimension)
+        else:
+            if compression == "none":
+                index = faiss.IndexIVFFlat(faiss.IndexFlatIP(dimension), dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+                index.train(train_sample(vectors, nlist * 256))
+            else:
+                index = new_coded_index(dimension, compression, self.index_config, nlist)
+                index.train(train_sample(vectors, max(nlist * 256, COMPRESS_MIN_VECTORS)))
+            if isinstance(index, faiss.IndexIVF):
+                # Hashtable direct map allows reconstruct() by arbitrary id
+                index.set_direct_map_type(faiss.DirectMap.Hashtable)
+                index.nprobe = min(self.index_config.ivf_nprobe, nlist)
+            else:
+                index = faiss.IndexIDMap2(index)
+        index.add_with_ids(vectors, ids)
+
+        self.index = index
+        self.index_kind = kind
+        self.compression = compression
+        print(f"Corpus index rebuilt as {kind} ({compression}, {nlist} lists, {index.ntotal} vectors)")
+
+    def add_document(self, doc_id: str, chunks: Sequence[str], embeddings: np.ndarray,
+                     pages: Optional[List[int]] = None) -> None:
+        """Add (or replace) a document's chunks, their embeddings and source pages."""
+        with stage_timer("index"):
+            self._add_document(doc_id, chunks, embeddings, pages)
+
+    def _add_document(self, doc_id: str, chunks: Sequence[str], embeddings: np.ndarray,
+                      pages: Optional[List[int]] = None) -> None:
+        # Ingested and stored vectors are already normalized, so memory-mapped ones serve reranking as they are
+        full_vectors = embeddings
+        embeddings = normalize(embeddings)
+        # Built next to the vectors at ingest time for the lexical/hybrid paths
+        lexical = BM25Index(chunks)
+        chunks = ChunkStore.from_chunks(chunks)
+        with self._lock:
+            if doc_id in self._docs:
+                self.remove_document(doc_id)
+
+            doc = _Document(self._next_doc_num, chunks, lexical, pages,
+                            full_vectors if self.index_config.compression != "none" else None)
+            self._next_doc_num += 1
+
+            if self.index is None:
+                self.index = self._new_flat(embeddings.shape[1])
+                self.index_kind = "flat"
+            if len(doc.chunks):
+                self.index.add_with_ids(embeddings, doc.ids)
+            self._docs[doc_id] = doc
+
+            if self.index_kind == "flat" and self.index.ntotal > self.index_config.flat_max_vectors:
+                self._rebuild("ivf")
+            elif (self.compression != self.index_config.compression
+                  and self.index.ntotal >= self.index_config.compress_min_vectors):
+                self._rebuild(self.index_kind)
+
+    def remove_document(self, doc_id: str) -> bool:
+        with self._lock:
+            doc = self._docs.pop(doc_id, None)
+            if doc is None:
+                return False
+            # IVF's hashtable direct map only accepts an explicit id array
+            self.index.remove_ids(faiss.IDSelectorArray(doc.ids))
+            return True
+
+    # ----- reading -----
+    def has_document(self, doc_id: str) -> bool:
+        return doc_id in self._docs
+
+    def document_chunks(self, doc_id: str) -> ChunkStore:
+        return self._docs[doc_id].chunks
+
+    def document_pages(self, doc_id: str) -> List[int]:
+        return self._docs[doc_id].pages
+
+    def document_lexical(self, doc_id: str) -> BM25Index:
+        return self._docs[doc_id].lexical
+
+    def document_memory_bytes(self, doc_id: str) -> int:
+        """Approximate RAM held for one document: vectors, chunk store and BM25 arrays."""
+        doc = self._docs[doc_id]
+        dimension = self.index.d if self.index is not None else 0
+        vector_bytes = len(doc.chunks) * bytes_per_vector(dimension, self.compression, self.index_config.pq_m)
+        if doc.vectors is not None and not isinstance(doc.vectors, np.memmap):
+            # Full vectors held in RAM rather than mapped from the index store
+            vector_bytes += doc.vectors.nbytes
+        chunk_bytes = doc.chunks.memory_bytes()
+        # Vocabulary dict entries cost roughly 100 bytes each on top of the arrays
+        lexical_bytes = doc.lexical.memory_bytes() + 100 * len(doc.lexical.vocab)
+        return vector_bytes + chunk_bytes + lexical_bytes
+
+    def document_vectors(self, doc_id: str) -> np.ndarray:
+        with self._lock:
+            return self._exact_vectors(self._docs[doc_id])
+
+    def _selector(self, doc_ids: Optional[Iterable[str]]):
+        if doc_ids is None:
+            return None
+        docs = [self._docs[doc_id] for doc_id in doc_ids if doc_id in self._docs]
+        if len(docs) == 1:
+            start = int(np.int64(docs[0].doc_num) << DOC_SHIFT)
+            return faiss.IDSelectorRange(start, start + (1 << DOC_SHIFT))
+        ids = np.concatenate([doc.ids for doc in docs]) if docs else np.empty(0, dtype=np.int64)
+        return faiss.IDSelectorBatch(ids)
+
+    def _exact_search(self, query_vectors: np.ndarray, doc_ids: List[str], k: int
+                      ) -> List[List[Tuple[str, int, float]]]:
+        """Brute-force search over the exact vectors of the given documents only."""
+        docs = [(doc_id, self._docs[doc_id]) for doc_id in dict.fromkeys(doc_ids) if doc_id in self._docs]
+        vectors = np.concatenate([self._exact_vectors(doc) for _, doc in docs])
+        owners = np.concatenate([np.full(len(doc.chunks), i) for i, (_, doc) in enumerate(docs)])
+        offsets = np.concatenate([np.arange(len(doc.chunks)) for _, doc in docs])
+        scores = query_vectors @ vectors.T
+        k = min(k, len(vectors))
+        results = []
+        for row in scores:
+            top = np.argpartition(-row, k - 1)[:k]
+            top = top[np.argsort(-row[top])]
+            results.append([(docs[owners[i]][0], int(offsets[i]), float(row[i])) for i in top])
+        return results
+
+    def search(self, query_vectors: np.ndarray, top_k: int = 5,
+               doc_ids: Optional[Iterable[str]] = None) -> List[List[Tuple[str, int, float]]]:
+        """Top matches per query as (doc_id, chunk_index, cosine score).
+
+        doc_ids=None searches everything; otherwise only the given documents.
+        Once the index is IVF, scoped queries scan those documents' exact
+        vectors instead: nprobe lists cover the corpus well, but only a few
+        of any single document's lists, so a selector alone loses most hits.
+        """
+        query_vectors = normalize(query_vectors)
+        with self._lock:
+            if self.index is None or self.index.ntotal == 0:
+                return [[] for _ in range(len(query_vectors))]
+            if doc_ids is not None:
+                doc_ids = list(doc_ids)
+                if not any(doc_id in self._docs and len(self._docs[doc_id].chunks) for doc_id in doc_ids):
+                    return [[] for _ in range(len(query_vectors))]
+                if isinstance(self.index, faiss.IndexIVF) and self.index.nprobe < self.index.nlist:
+                    return self._exact_search(query_vectors, doc_ids, top_k)
+
+            selector = self._selector(doc_ids)
+            if isinstance(self.index, faiss.IndexIVF):
+                params = faiss.SearchParametersIVF(sel=selector, nprobe=min(self.index_config.ivf_nprobe,
+                                                                            self.index.nlist))
+            else:
+                params = faiss.SearchParameters(sel=selector) if selector is not None else None
+
+            k = min(top_k, self.index.ntotal)
+            compressed = self.compression != "none"
+            # Compressed scores are approximate: fetch extra candidates and rescore them exactly
+            fetch = min(k * self.index_config.rerank_factor, self.index.ntotal) if compressed else k
+            scores, ids = self.index.search(query_vectors, fetch, params=params)
+
+            by_num = {doc.doc_num: doc_id for doc_id, doc in self._docs.items()}
+            results = []
+            for row_scores, row_ids in zip(scores, ids):
+                row = []
+                for score, vector_id in zip(row_scores, row_ids):
+                    if vector_id == -1:
+                        continue
+                    doc_id = by_num.get(int(vector_id) >> DOC_SHIFT)
+                    if doc_id is not None:
+                        row.append((doc_id, int(vector_id) & ((1 << DOC_SHIFT) - 1), float(score)))
+                results.append(row)
+            if compressed:
+                results = [
+                    [(doc_id, chunk_idx, score) for score, doc_id, chunk_idx in rerank(
+                        query, [(doc_id, chunk_idx) for doc_id, chunk_idx, _ in row],
+                        lambda doc_id: self._exact_vectors(self._docs[doc_id]), k)]
+                    for query, row in zip(query_vectors, results)
+                ]
+            return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "documents": len(self._docs),
+            "vectors": self.index.ntotal if self.index is not None else 0,
+            "index_kind": self.index_kind,
+            "compression": self.compression,
+            "bytes_per_vector": bytes_per_vector(self.index.d, self.compression, self.index_config.pq_m)
+            if self.index is not None else None,
+        }
+
+
+class DocumentRetriever:
+    """Per-session view of the corpus index, with the OptimizedEmbedder query API."""
+
+    def __init__(self, corpus: CorpusIndex, doc_id: str, model_name: str = DEFAULT_MODEL_NAME,
+                 batcher=None):
+        self.corpus = corpus
+        self.doc_id = doc_id
+        self.model = get_model(model_name)
+        # Optional QueryBatcher that shares encode/search calls with concurrent chats
+        self.batcher = batcher
+
+    @property
+    def chunks(self) -> ChunkStore:
+        return self.corpus.document_chunks(self.doc_id)
+
+    @property
+    def index_kind(self) -> Optional[str]:
+        return self.corpus.index_kind
+
+    def pages_for(self, chunk_indices: Iterable[int]) -> List[int]:
+        """Sorted distinct pages the given chunks start on."""
+        pages = self.corpus.document_pages(self.doc_id)
+        return sorted({pages[i] for i in chunk_indices}) if pages else []
+
+    def encode_query(self, question: str) -> np.ndarray:
+        return self.model.encode([question], convert_to_numpy=True)
+
+    def _vector_search(self, question: str, k: int) -> List[Tuple[int, float]]:
+        if self.batcher is not None:
+            hits = self.batcher.search(question, k, doc_ids=[self.doc_id])
+        else:
+            hits = self.corpus.search(self.encode_query(question), k, doc_ids=[self.doc_id])[0]
+        return [(chunk_idx, score) for _, chunk_idx, score in hits]
+
+    def query_hits(self, question: str, top_k: int = 5,
+                   mode: str = DEFAULT_RETRIEVAL_MODE) -> List[Tuple[int, float]]:
+        """(chunk index, score) pairs, best first."""
+        with stage_timer("search"):
+            return hybrid_search(question, top_k, mode, self.corpus.document_lexical(self.doc_id),
+                                 lambda k: self._vector_search(question, k))
+
+    def query_with_scores(self, question: str, top_k: int = 5,
+                          mode: str = DEFAULT_RETRIEVAL_MODE) -> List[Tuple[str, float]]:
+        chunks = self.chunks
+        return [(chunks[chunk_idx], score) for chunk_idx, score in self.query_hits(question, top_k, mode)]
+
+    def query(self, question: str, top_k: int = 5, mode: str = DEFAULT_RETRIEVAL_MODE) -> List[str]:
+        """Query the index for relevant chunks."""
+        return [chunk for chunk, _ in self.query_with_scores(question, top_k, mode)]
+
+    def recall_report(self, k: int = 5, sample_queries: int = 200):
+        vectors = self.corpus.document_vectors(self.doc_id)
+        if len(vectors) == 0:
+            return None
+        sample = np.random.default_rng(0).choice(len(vectors), min(sample_queries, len(vectors)), replace=False)
+        return recall_report(vectors, vectors[sample], self.corpus.index_config, k=k)
+
+    def compression_report(self, k: int = 5, sample_queries: int = 200):
+        vectors = self.corpus.document_vectors(self.doc_id)
+        if len(vectors) == 0:
+            return None
+        sample = np.random.default_rng(0).choice(len(vectors), min(sample_queries, len(vectors)), replace=False)
+        return compression_report(vectors, vectors[np.sort(sample)], self.corpus.index_config, k=k)
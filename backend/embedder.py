@@ -1,54 +1,178 @@
-from sentence_transformers import SentenceTransformer
 import faiss
 import numpy as np
-from typing import List
+from typing import List, Optional, Tuple
+
+from ann_index import IndexConfig, build_ann_index, normalize, recall_report
+from embedding_cache import get_embedding_cache
+from lexical_index import DEFAULT_RETRIEVAL_MODE, BM25Index, hybrid_search
+from metrics import stage_timer
+from model_registry import DEFAULT_MODEL_NAME, get_model
 
 class OptimizedEmbedder:
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
-        self.model = SentenceTransformer(model_name)
+    def __init__(self, model_name: str = DEFAULT_MODEL_NAME, use_cache: bool = True,
+                 index_config: Optional[IndexConfig] = None, index_vectors: bool = True):
+        # The model is shared process-wide; only the index and chunks are per-session
+        self.model_name = model_name
+        self.model = get_model(model_name)
+        self.cache = get_embedding_cache(model_name, self.model.get_sentence_embedding_dimension()) if use_cache else None
+        self.index_config = index_config or IndexConfig()
+        # False when the vectors go into a shared CorpusIndex instead of a local one
+        self.index_vectors = index_vectors
+        self.index_kind = None
         self.index = None
+        self.lexical = None
         self.chunks = []
+        self.embeddings = None
+        # Embeddings written so far, with spare rows to grow into
+        self._buffer: Optional[np.ndarray] = None
+        self._count = 0
+        self._reserved = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
         
-    def build_index(self, chunks: List[str]):
+    def build_index(self, chunks: List[str], batch_size: int = 32):
         """Build FAISS index with batch processing."""
-        self.chunks = chunks
-        
-        # Process embeddings in batches to avoid memory issues
-        batch_size = 32
-        all_embeddings = []
+        self.reset()
+        self.reserve(len(chunks))
         
         print(f"Processing {len(chunks)} chunks in batches of {batch_size}...")
         
+        # Process embeddings in batches to avoid memory issues
         for i in range(0, len(chunks), batch_size):
-            batch_chunks = chunks[i:i + batch_size]
-            batch_embeddings = self.model.encode(batch_chunks, convert_to_numpy=True)
-            all_embeddings.append(batch_embeddings)
-            print(f"Processed batch {i//batch_size + 1}/{(len(chunks)-1)//batch_size + 1}")
+            self.add_chunks(chunks[i:i + batch_size])
+        
+        self.finalize()
+    
+    def reset(self):
+        self.index_kind = None
+        self.index = None
+        self.lexical = None
+        self.chunks = []
+        self.embeddings = None
+        self._buffer = None
+        self._count = 0
+        self._reserved = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+    
+    def reserve(self, count: int):
+        """Size the embeddings buffer for count chunks when the first batch allocates it.
+
+        The buffer is created by the first batch, once the embedding dimension
+        is known; without a reservation (the streaming pipeline doesn't know
+        the chunk count) it grows by doubling.
+        """
+        self._reserved = count
+    
+    def _append_embeddings(self, batch_embeddings: np.ndarray):
+        """Copy a batch into the preallocated array, doubling it when full."""
+        needed = self._count + len(batch_embeddings)
+        capacity = len(self._buffer) if self._buffer is not None else 0
+        if needed > capacity:
+            grown = np.empty((max(needed, self._reserved, 2 * capacity), batch_embeddings.shape[1]), dtype=np.float32)
+            if self._count:
+                grown[:self._count] = self._buffer[:self._count]
+            self._buffer = grown
+        self._buffer[self._count:needed] = batch_embeddings
+        self._count = needed
+    
+    def encode_chunks(self, batch_chunks: List[str]) -> np.ndarray:
+        """Embed chunks, only sending embedding-cache misses to the model."""
+        if self.cache is None:
+            self.cache_misses += len(batch_chunks)
+            with stage_timer("embed"):
+                return self.model.encode(batch_chunks, convert_to_numpy=True)
         
-        # Combine all embeddings
-        embeddings_array = np.vstack(all_embeddings)
-        dimension = embeddings_array.shape[1]
+        embeddings, missing = self.cache.lookup(batch_chunks)
+        if missing:
+            missing_chunks = [batch_chunks[i] for i in missing]
+            with stage_timer("embed"):
+                encoded = self.model.encode(missing_chunks, convert_to_numpy=True)
+            embeddings[missing] = encoded
+            self.cache.add(missing_chunks, encoded)
+        self.cache_hits += len(batch_chunks) - len(missing)
+        self.cache_misses += len(missing)
+        return embeddings
+    
+    def cache_stats(self):
+        """Embedding cache hit rate for the current ingestion."""
+        total = self.cache_hits + self.cache_misses
+        return {
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "hit_rate": round(self.cache_hits / total, 3) if total else 0.0,
+        }
+    
+    def add_chunks(self, batch_chunks: List[str]):
+        """Embed one batch and append it to the index (used by the streaming pipeline)."""
+        if not batch_chunks:
+            return
+        # Normalized vectors + inner product: search scores are cosine similarities
+        batch_embeddings = normalize(self.encode_chunks(batch_chunks))
         
-        # Build FAISS index
-        self.index = faiss.IndexFlatL2(dimension)
-        self.index.add(embeddings_array)
-        print(f"Index built with {self.index.ntotal} vectors")
+        # Vectors go into a flat index as they stream in; finalize() may swap in an ANN index
+        if self.index_vectors:
+            if self.index is None:
+                self.index = faiss.IndexFlatIP(batch_embeddings.shape[1])
+                self.index_kind = "flat"
+            self.index.add(batch_embeddings)
+        self.chunks.extend(batch_chunks)
+        self._append_embeddings(batch_embeddings)
     
-    def query(self, question: str, top_k: int = 5) -> List[str]:
+    def finalize(self):
+        """Consolidate the embeddings and pick the index type for the corpus size."""
+        with stage_timer("index"):
+            self._consolidate()
+        if self.index is not None:
+            stats = self.cache_stats()
+            print(f"Index built with {self.index.ntotal} vectors "
+                  f"({self.index_kind}, embedding cache hit rate {stats['hit_rate']:.0%})")
+
+    def _consolidate(self):
+        if self._buffer is not None:
+            if len(self._buffer) > self._count:
+                # Give back the spare rows; no views of the buffer exist yet
+                self._buffer.resize((self._count, self._buffer.shape[1]), refcheck=False)
+            self.embeddings = self._buffer
+        if self.index_vectors and self.embeddings is not None:
+            kind = self.index_config.choose_kind(len(self.embeddings))
+            if kind != self.index_kind:
+                self.index = build_ann_index(self.embeddings, self.index_config, kind=kind)
+                self.index_kind = kind
+            self.lexical = BM25Index(self.chunks)
+
+    def query(self, question: str, top_k: int = 5, mode: str = DEFAULT_RETRIEVAL_MODE) -> List[str]:
         """Query the index for relevant chunks."""
+        return [chunk for chunk, _ in self.query_with_scores(question, top_k, mode)]
+    
+    def query_with_scores(self, question: str, top_k: int = 5,
+                          mode: str = DEFAULT_RETRIEVAL_MODE) -> List[Tuple[str, float]]:
+        """Relevant chunks with their score (cosine, BM25 or fused rank, depending on mode)."""
+        return [(self.chunks[idx], score) for idx, score in self.query_hits(question, top_k, mode)]
+    
+    def query_hits(self, question: str, top_k: int = 5,
+                   mode: str = DEFAULT_RETRIEVAL_MODE) -> List[Tuple[int, float]]:
+        """(chunk index, score) pairs, best first."""
         if self.index is None:
             return []
-        
+        with stage_timer("search"):
+            return hybrid_search(question, top_k, mode, self.lexical,
+                                 lambda k: self._vector_search(question, k))
+    
+    def _vector_search(self, question: str, k: int) -> List[Tuple[int, float]]:
         # Get embedding for question
-        q_embedding = self.model.encode([question], convert_to_numpy=True)
+        q_embedding = normalize(self.model.encode([question], convert_to_numpy=True))
         
         # Search
-        distances, indices = self.index.search(q_embedding, min(top_k, len(self.chunks)))
+        scores, indices = self.index.search(q_embedding, min(k, len(self.chunks)))
         
-        # Return relevant chunks
-        results = []
-        for idx in indices[0]:
-            if idx != -1:  # Valid index
-                results.append(self.chunks[idx])
-        
-        return results
\ No newline at end of file
+        # Valid indices only
+        return [(int(idx), float(score)) for idx, score in zip(indices[0], scores[0]) if idx != -1]
+    
+    def recall_report(self, k: int = 5, sample_queries: int = 200):
+        """Recall-vs-latency of ANN settings on this document, chunks as queries."""
+        if self.embeddings is None:
+            return None
+        rng = np.random.default_rng(0)
+        sample = rng.choice(len(self.embeddings), min(sample_queries, len(self.embeddings)), replace=False)
+        return recall_report(self.embeddings, np.asarray(self.embeddings[sample]), self.index_config, k=k)
\ No newline at end of file
@@ -0,0 +1,140 @@
+import fcntl
+import hashlib
+import os
+import re
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+EMBEDDING_CACHE_DIR = os.getenv(
+    "PDF_EMBEDDING_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "embedding_cache"),
+)
+
+DIGEST_SIZE = 16
+KEYS_FILE = "keys.bin"
+VECTORS_FILE = "vectors.f32"
+LOCK_FILE = ".lock"
+
+
+def text_digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=DIGEST_SIZE).digest()
+
+
+class EmbeddingCache:
+    """Chunk embeddings keyed by text hash, one append-only vector file per model.
+
+    keys.bin holds fixed-size digests and vectors.f32 the matching float32
+    rows in the same order, so the whole cache is two flat files that are
+    memory-mapped for reads. Appends take a file lock so several worker
+    processes can share one cache directory.
+    """
+
+    def __init__(self, model_name: str, dimension: int, root: str = EMBEDDING_CACHE_DIR):
+        self.model_name = model_name
+        self.dimension = dimension
+        self.row_bytes = dimension * np.dtype(np.float32).itemsize
+        self.directory = os.path.join(root, re.sub(r"[^A-Za-z0-9_.-]", "_", model_name))
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._keys_path = os.path.join(self.directory, KEYS_FILE)
+        self._vectors_path = os.path.join(self.directory, VECTORS_FILE)
+        self._lock_path = os.path.join(self.directory, LOCK_FILE)
+        self._lock = threading.Lock()
+
+        self._rows: Dict[bytes, int] = {}
+        self._row_count = 0
+        self._vectors = None
+        with self._lock:
+            self._refresh()
+
+    @contextmanager
+    def _file_lock(self):
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refresh(self):
+        """Pick up rows appended since the last read (possibly by another process)."""
+        if not os.path.exists(self._keys_path):
+            return
+        key_count = os.path.getsize(self._keys_path) // DIGEST_SIZE
+        vector_count = os.path.getsize(self._vectors_path) // self.row_bytes if os.path.exists(self._vectors_path) else 0
+        # Vectors are written before keys, so only trust rows present in both files
+        rows = min(key_count, vector_count)
+        if rows <= self._row_count:
+            return
+
+        with open(self._keys_path, "rb") as f:
+            f.seek(self._row_count * DIGEST_SIZE)
+            new_keys = f.read((rows - self._row_count) * DIGEST_SIZE)
+        for i in range(0, len(new_keys), DIGEST_SIZE):
+            self._rows.setdefault(new_keys[i:i + DIGEST_SIZE], self._row_count + i // DIGEST_SIZE)
+
+        self._row_count = rows
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r",
+                                  shape=(rows, self.dimension))
+
+    def lookup(self, texts: Sequence[str]) -> Tuple[np.ndarray, List[int]]:
+        """Return (vectors, missing): rows for cached texts, indices of texts still to embed."""
+        digests = [text_digest(text) for text in texts]
+        vectors = np.empty((len(texts), self.dimension), dtype=np.float32)
+        missing = []
+        with self._lock:
+            if any(digest not in self._rows for digest in digests):
+                self._refresh()
+            for i, digest in enumerate(digests):
+                row = self._rows.get(digest)
+                if row is None:
+                    missing.append(i)
+                else:
+                    vectors[i] = self._vectors[row]
+        return vectors, missing
+
+    def add(self, texts: Sequence[str], vectors: np.ndarray) -> None:
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self._lock, self._file_lock():
+            self._refresh()
+            new_keys = []
+            new_rows = []
+            for text, vector in zip(texts, vectors):
+                digest = text_digest(text)
+                if digest in self._rows or digest in new_keys:
+                    continue
+                new_keys.append(digest)
+                new_rows.append(vector)
+            if not new_keys:
+                return
+
+            # Trim any torn tail from an interrupted writer before appending
+            for path, size in ((self._vectors_path, self._row_count * self.row_bytes),
+                               (self._keys_path, self._row_count * DIGEST_SIZE)):
+                with open(path, "ab") as f:
+                    f.truncate(size)
+
+            with open(self._vectors_path, "ab") as f:
+                f.write(np.vstack(new_rows).tobytes())
+            with open(self._keys_path, "ab") as f:
+                f.write(b"".join(new_keys))
+            self._refresh()
+
+    def __len__(self) -> int:
+        return self._row_count
+
+
+_caches: Dict[str, EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(model_name: str, dimension: int) -> EmbeddingCache:
+    """One shared cache instance per model in this process."""
+    with _caches_lock:
+        cache = _caches.get(model_name)
+        if cache is None:
+            cache = _caches[model_name] = EmbeddingCache(model_name, dimension)
+        return cache
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from typing import Any, Dict, Optional, Sequence
+
+import faiss
+import numpy as np
+
+from chunk_store import ChunkStore
+
+INDEX_STORE_DIR = os.getenv(
+    "PDF_INDEX_STORE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "index_store"),
+)
+
+VECTORS_FILE = "vectors.npy"
+INDEX_FILE = "index.faiss"
+META_FILE = "meta.json"
+
+
+def content_key(pdf_sha256: str, **params: Any) -> str:
+    """Key a stored index by the PDF bytes and every parameter that shapes it."""
+    payload = json.dumps({"pdf": pdf_sha256, **params}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _read_index(path: str):
+    """Memory-map the index when the index type supports it."""
+    try:
+        return faiss.read_index(path, faiss.IO_FLAG_MMAP)
+    except RuntimeError:
+        return faiss.read_index(path)
+
+
+class IndexStore:
+    """On-disk, content-addressed store of chunks, vectors and FAISS indexes."""
+
+    def __init__(self, root: str = INDEX_STORE_DIR):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def has(self, key: str) -> bool:
+        return os.path.exists(os.path.join(self.path(key), META_FILE))
+
+    def save(self, key: str, chunks: Sequence[str], vectors: np.ndarray, index,
+             metadata: Optional[Dict[str, Any]] = None) -> str:
+        """Write an entry atomically so readers never see a partial directory."""
+        final_dir = self.path(key)
+        if self.has(key):
+            return final_dir
+
+        parent = os.path.dirname(final_dir)
+        os.makedirs(parent, exist_ok=True)
+        tmp_dir = os.path.join(parent, f".{key}.{uuid.uuid4().hex}.tmp")
+        os.makedirs(tmp_dir)
+
+        try:
+            ChunkStore.from_chunks(chunks).save(tmp_dir)
+            np.save(os.path.join(tmp_dir, VECTORS_FILE), np.ascontiguousarray(vectors, dtype=np.float32))
+            # Entries feeding the shared corpus index only need the vectors
+            if index is not None:
+                faiss.write_index(index, os.path.join(tmp_dir, INDEX_FILE))
+
+            # meta.json is written last and marks the entry as complete
+            meta = dict(metadata or {})
+            meta.update({"key": key, "chunks_count": len(chunks), "created_at": time.time()})
+            with open(os.path.join(tmp_dir, META_FILE), "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+
+            os.rename(tmp_dir, final_dir)
+        except OSError:
+            # Lost a race with another writer of the same key
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            if not self.has(key):
+                raise
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        return final_dir
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        """Load a stored entry, memory-mapping the vectors and index."""
+        if not self.has(key):
+            return None
+
+        entry_dir = self.path(key)
+        index_path = os.path.join(entry_dir, INDEX_FILE)
+        with open(os.path.join(entry_dir, META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+
+        return {
+            "chunks": ChunkStore.load(entry_dir),
+            "vectors": np.load(os.path.join(entry_dir, VECTORS_FILE), mmap_mode="r"),
+            "index": _read_index(index_path) if os.path.exists(index_path) else None,
+            "meta": meta,
+        }
+
+    def load_vectors(self, key: str) -> Optional[np.ndarray]:
+        """Memory-map just the full-precision vectors of a stored entry."""
+        if not self.has(key):
+            return None
+        return np.load(os.path.join(self.path(key), VECTORS_FILE), mmap_mode="r")
+
+    def delete(self, key: str) -> None:
+        shutil.rmtree(self.path(key), ignore_errors=True)
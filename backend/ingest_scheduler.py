@@ -0,0 +1,144 @@
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# Ingestion jobs that may parse and embed at the same time
+INGEST_MAX_JOBS = int(os.getenv("INGEST_MAX_JOBS", "2"))
+
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+DEFAULT_PRIORITY = "normal"
+
+QUEUED = "queued"
+RUNNING = "running"
+
+
+class IngestionCancelled(Exception):
+    pass
+
+
+class IngestJob:
+    def __init__(self, job_id: str, run: Callable[[threading.Event], Awaitable[None]],
+                 priority: int, seq: int, on_cancel: Optional[Callable[[], None]]):
+        self.job_id = job_id
+        self.run = run
+        self.priority = priority
+        self.seq = seq
+        self.on_cancel = on_cancel
+        # Checked by the ingestion threads; set to stop a running job
+        self.cancel_event = threading.Event()
+        self.state = QUEUED
+        self.submitted_at = time.time()
+
+    def __lt__(self, other: "IngestJob") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class IngestionScheduler:
+    """Run at most max_jobs ingestion jobs at once, highest priority first.
+
+    Jobs of equal priority run in submission order. run(cancel_event) is a
+    coroutine function; cancel() drops a queued job (calling its on_cancel
+    cleanup) or signals a running one through its cancel_event.
+    """
+
+    def __init__(self, max_jobs: int = INGEST_MAX_JOBS):
+        self.max_jobs = max(1, max_jobs)
+        self._queue: List[IngestJob] = []
+        self._jobs: Dict[str, IngestJob] = {}
+        self._seq = itertools.count()
+        self._ready = asyncio.Condition()
+        self._workers: List[asyncio.Task] = []
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self._wait_seconds = 0.0
+        self._started_jobs = 0
+
+    def workers_per_job(self) -> int:
+        """Parser processes each job may use so concurrent jobs share the CPUs."""
+        return max(1, (os.cpu_count() or 1) // self.max_jobs)
+
+    def start(self) -> None:
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.max_jobs)]
+
+    async def stop(self) -> None:
+        for job in self._jobs.values():
+            job.cancel_event.set()
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def submit(self, job_id: str, run: Callable[[threading.Event], Awaitable[None]],
+                     priority: str = DEFAULT_PRIORITY,
+                     on_cancel: Optional[Callable[[], None]] = None) -> int:
+        """Queue a job and return its 1-based queue position."""
+        job = IngestJob(job_id, run, PRIORITIES[priority], next(self._seq), on_cancel)
+        async with self._ready:
+            self._jobs[job_id] = job
+            heapq.heappush(self._queue, job)
+            self._ready.notify()
+        return self.position(job_id)
+
+    def position(self, job_id: str) -> Optional[int]:
+        """1-based place in the queue, 0 while running, None if unknown or finished."""
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        if job.state == RUNNING:
+            return 0
+        return 1 + sum(1 for other in self._queue if other < job)
+
+    def cancel(self, job_id: str) -> bool:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return False
+        job.cancel_event.set()
+        if job.state == QUEUED:
+            self._queue.remove(job)
+            heapq.heapify(self._queue)
+            del self._jobs[job_id]
+            self.cancelled += 1
+            if job.on_cancel is not None:
+                job.on_cancel()
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            async with self._ready:
+                while not self._queue:
+                    await self._ready.wait()
+                job = heapq.heappop(self._queue)
+                job.state = RUNNING
+            self._started_jobs += 1
+            self._wait_seconds += time.time() - job.submitted_at
+            try:
+                await job.run(job.cancel_event)
+                if job.cancel_event.is_set():
+                    self.cancelled += 1
+                else:
+                    self.completed += 1
+            except IngestionCancelled:
+                self.cancelled += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"Ingestion job {job.job_id} failed: {e}")
+            finally:
+                self._jobs.pop(job.job_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_jobs": self.max_jobs,
+            "workers_per_job": self.workers_per_job(),
+            "queued": len(self._queue),
+            "running": sum(1 for job in self._jobs.values() if job.state == RUNNING),
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "avg_queue_wait_seconds": round(self._wait_seconds / self._started_jobs, 3) if self._started_jobs else 0.0,
+        }
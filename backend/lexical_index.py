@@ -0,0 +1,131 @@
+import re
+from collections import Counter
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+# "auto" takes the lexical-only path for exact-term lookups, hybrid otherwise
+RETRIEVAL_MODES = ("auto", "hybrid", "vector", "lexical")
+# Pure vector search, as before hybrid retrieval existed; callers opt in to the others
+DEFAULT_RETRIEVAL_MODE = "vector"
+
+# Keep clause numbers (4.2.1), part ids (AB-1234/X) and names intact as single tokens
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[._\-/][a-z0-9]+)*")
+
+RRF_K = 60
+CANDIDATE_MULTIPLIER = 4
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+def is_exact_lookup(question: str) -> bool:
+    """Short queries naming an identifier (anything with a digit) are best served lexically."""
+    tokens = tokenize(question)
+    return 0 < len(tokens) <= 4 and any(any(c.isdigit() for c in token) for token in tokens)
+
+
+class BM25Index:
+    """Okapi BM25 over chunks, stored as CSR arrays instead of dicts of Python lists.
+
+    Postings for term t are doc_ids[indptr[t]:indptr[t + 1]] with matching
+    term_freqs; only the vocabulary itself is a dict.
+    """
+
+    def __init__(self, chunks: Sequence[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.vocab: Dict[str, int] = {}
+
+        term_ids: List[int] = []
+        doc_ids: List[int] = []
+        freqs: List[int] = []
+        doc_lengths = np.zeros(len(chunks), dtype=np.int32)
+
+        for doc, chunk in enumerate(chunks):
+            tokens = tokenize(chunk)
+            doc_lengths[doc] = len(tokens)
+            for term, freq in Counter(tokens).items():
+                term_ids.append(self.vocab.setdefault(term, len(self.vocab)))
+                doc_ids.append(doc)
+                freqs.append(freq)
+
+        term_array = np.asarray(term_ids, dtype=np.int32)
+        order = np.argsort(term_array, kind="stable")
+        self.doc_ids = np.asarray(doc_ids, dtype=np.int32)[order]
+        self.term_freqs = np.asarray(freqs, dtype=np.float32)[order]
+        doc_freqs = np.bincount(term_array, minlength=len(self.vocab))
+        self.indptr = np.concatenate(([0], np.cumsum(doc_freqs))).astype(np.int64)
+
+        self.n_docs = len(chunks)
+        self.doc_lengths = doc_lengths
+        avg_length = float(doc_lengths.mean()) if self.n_docs else 0.0
+        # Per-document length normalization, precomputed once
+        self.length_norm = (k1 * (1 - b + b * doc_lengths / avg_length)).astype(np.float32) if avg_length else \
+            np.full(self.n_docs, k1, dtype=np.float32)
+        self.idf = np.log1p((self.n_docs - doc_freqs + 0.5) / (doc_freqs + 0.5)).astype(np.float32)
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[int, float]]:
+        """(chunk index, BM25 score) for the best matching chunks."""
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        matched = False
+        for term in set(tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            matched = True
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.term_freqs[start:end]
+            scores[docs] += self.idf[term_id] * tf * (self.k1 + 1) / (tf + self.length_norm[docs])
+
+        if not matched:
+            return []
+        top_k = min(top_k, int(np.count_nonzero(scores)))
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+        return [(int(doc), float(scores[doc])) for doc in best]
+
+    def memory_bytes(self) -> int:
+        arrays = (self.doc_ids, self.term_freqs, self.indptr, self.doc_lengths, self.length_norm, self.idf)
+        return sum(array.nbytes for array in arrays)
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = RRF_K) -> List[Tuple[int, float]]:
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            scores[doc] = scores.get(doc, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def hybrid_search(
+    question: str,
+    top_k: int,
+    mode: str,
+    lexical: BM25Index,
+    vector_search: Callable[[int], List[Tuple[int, float]]],
+) -> List[Tuple[int, float]]:
+    """Retrieve (chunk index, score) by BM25, vectors, or their RRF fusion.
+
+    vector_search(k) is only called when the mode needs it, so lexical
+    lookups never embed the question.
+    """
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode: {mode}")
+
+    if mode == "lexical":
+        return lexical.search(question, top_k)
+    if mode == "vector":
+        return vector_search(top_k)
+    if mode == "auto" and is_exact_lookup(question):
+        hits = lexical.search(question, top_k)
+        if hits:
+            return hits
+
+    candidates = top_k * CANDIDATE_MULTIPLIER
+    lexical_hits = lexical.search(question, candidates)
+    vector_hits = vector_search(candidates)
+    fused = reciprocal_rank_fusion([[doc for doc, _ in lexical_hits], [doc for doc, _ in vector_hits]])
+    return fused[:top_k]
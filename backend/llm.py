@@ -1,17 +1,228 @@
+import json
+import os
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
 import requests
 
-OLLAMA_API_URL = "http://localhost:11434/api/generate"
+from llm_cache import ERROR_PREFIX, LLMCache, cache_key
+from llm_pool import LLMBackend, LLMBackendPool, NoBackendAvailable, is_backend_failure
+from metrics import LLM_CACHE_HITS, LLM_REQUEST_SECONDS, LLM_TOKENS, record_span
+
+OLLAMA_API_URL = os.getenv("OLLAMA_API_URL", "http://localhost:11434/api/generate")
+
+# Comma-separated generate URLs of several Ollama servers to spread requests over
+OLLAMA_API_URLS = [url.strip() for url in os.getenv("OLLAMA_API_URLS", OLLAMA_API_URL).split(",") if url.strip()]
+
+# Connection handling shared by the sync and async clients; the limit is per backend
+LLM_MAX_CONCURRENCY = 4
+LLM_CONNECT_TIMEOUT = 5.0
+LLM_READ_TIMEOUT = 60.0  # prevents hanging forever
+
+# Response cache shared by every caller; set LLM_CACHE_PATH to keep it across restarts,
+# LLM_CACHE_ENABLED=0 to send every call to Ollama (e.g. under load tests)
+llm_cache = LLMCache(disk_path=os.getenv("LLM_CACHE_PATH"), enabled=os.getenv("LLM_CACHE_ENABLED", "1") != "0")
+
+# Every Ollama server, with health probing and a circuit breaker per server
+llm_pool = LLMBackendPool(OLLAMA_API_URLS, max_concurrency=LLM_MAX_CONCURRENCY)
+
+# Keep-alive session so sync callers reuse TCP connections too
+_session = requests.Session()
+
+def _record_llm_call(mode: str, outcome: str, started: float, data: Optional[Dict[str, Any]] = None):
+    """Latency histogram, request trace span and, from Ollama's final message, token counts."""
+    seconds = time.perf_counter() - started
+    LLM_REQUEST_SECONDS.labels(mode, outcome).observe(seconds)
+    record_span("llm", started, seconds)
+    if data:
+        LLM_TOKENS.labels("prompt").inc(data.get("prompt_eval_count", 0))
+        LLM_TOKENS.labels("completion").inc(data.get("eval_count", 0))
 
 def query_llm(prompt, model="llama3"):
     """Query Ollama via its persistent API server."""
-    try:
-        response = requests.post(
-            OLLAMA_API_URL,
-            json={"model": model, "prompt": prompt, "stream": False},
-            timeout=60  # prevents hanging forever
-        )
-        response.raise_for_status()
-        data = response.json()
-        return data.get("response", "").strip()
-    except Exception as e:
-        return f"Error querying Ollama: {e}"
\ No newline at end of file
+    key = cache_key(model, prompt)
+    cached = llm_cache.get(key)
+    if cached is not None:
+        LLM_CACHE_HITS.inc()
+        return cached
+    started = time.perf_counter()
+    tried: List[LLMBackend] = []
+    error: Optional[Exception] = None
+    # A failed backend is retried on the next one until none is left; a rejected request is not
+    while True:
+        try:
+            with llm_pool.lease(exclude=tried) as backend:
+                tried.append(backend)
+                response = _session.post(
+                    backend.url,
+                    json={"model": model, "prompt": prompt, "stream": False},
+                    timeout=(LLM_CONNECT_TIMEOUT, LLM_READ_TIMEOUT)
+                )
+                response.raise_for_status()
+                data = response.json()
+            answer = data.get("response", "").strip()
+            _record_llm_call("sync", "ok", started, data)
+            llm_cache.put(key, answer)
+            return answer
+        except NoBackendAvailable as e:
+            _record_llm_call("sync", "error", started)
+            return f"{ERROR_PREFIX}: {error or e}"
+        except Exception as e:
+            if not is_backend_failure(e):
+                _record_llm_call("sync", "error", started)
+                return f"{ERROR_PREFIX}: {e}"
+            error = e
+
+
+class AsyncOllamaClient:
+    """Native async Ollama client with a pooled keep-alive connection set.
+
+    Requests are routed through an LLMBackendPool. A generate call that hits
+    a connect error, timeout or 5xx is retried on another backend; a stream
+    fails over only before its first token, since tokens already sent cannot
+    be taken back. A 4xx (unknown model, bad payload) is returned at once.
+    """
+
+    def __init__(
+        self,
+        api_url: str = OLLAMA_API_URL,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        connect_timeout: float = LLM_CONNECT_TIMEOUT,
+        read_timeout: float = LLM_READ_TIMEOUT,
+        cache: Optional[LLMCache] = None,
+        pool: Optional[LLMBackendPool] = None,
+    ):
+        self.pool = pool or LLMBackendPool([api_url], max_concurrency=max_concurrency)
+        self.cache = cache
+        self.max_concurrency = max_concurrency * len(self.pool.backends)
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created lazily so it binds to the running event loop
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                ),
+            )
+        return self._client
+
+    async def generate(self, prompt: str, model: str = "llama3",
+                       options: Optional[Dict[str, Any]] = None, use_cache: bool = True) -> str:
+        use_cache = use_cache and self.cache is not None
+        key = cache_key(model, prompt, options)
+        if use_cache:
+            cached = await self.cache.aget(key)
+            if cached is not None:
+                LLM_CACHE_HITS.inc()
+                return cached
+
+        payload: Dict[str, Any] = {"model": model, "prompt": prompt, "stream": False}
+        if options:
+            payload["options"] = options
+        started = time.perf_counter()
+        tried: List[LLMBackend] = []
+        error: Optional[Exception] = None
+        while True:
+            try:
+                with self.pool.lease(exclude=tried) as backend:
+                    tried.append(backend)
+                    async with backend.semaphore:
+                        response = await self.client.post(backend.url, json=payload)
+                    response.raise_for_status()
+                    data = response.json()
+                answer = data.get("response", "").strip()
+                break
+            except NoBackendAvailable as e:
+                _record_llm_call("generate", "error", started)
+                return f"{ERROR_PREFIX}: {error or e}"
+            except Exception as e:
+                if not is_backend_failure(e):
+                    _record_llm_call("generate", "error", started)
+                    return f"{ERROR_PREFIX}: {e}"
+                error = e
+        _record_llm_call("generate", "ok", started, data)
+
+        if use_cache:
+            await self.cache.aput(key, answer)
+        return answer
+
+    async def stream(self, prompt: str, model: str = "llama3",
+                     options: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        """Yield response tokens as Ollama streams its NDJSON lines."""
+        payload: Dict[str, Any] = {"model": model, "prompt": prompt, "stream": True}
+        if options:
+            payload["options"] = options
+        started = time.perf_counter()
+        final: Optional[Dict[str, Any]] = None
+        tried: List[LLMBackend] = []
+        error: Optional[Exception] = None
+        try:
+            while True:
+                streamed = False
+                try:
+                    with self.pool.lease(exclude=tried) as backend:
+                        tried.append(backend)
+                        async with backend.semaphore:
+                            async with self.client.stream("POST", backend.url, json=payload) as response:
+                                response.raise_for_status()
+                                async for line in response.aiter_lines():
+                                    if not line:
+                                        continue
+                                    data = json.loads(line)
+                                    if data.get("error"):
+                                        raise RuntimeError(data["error"])
+                                    token = data.get("response", "")
+                                    if token:
+                                        streamed = True
+                                        yield token
+                                    if data.get("done"):
+                                        final = data
+                                        break
+                    break
+                except NoBackendAvailable:
+                    if error is not None:
+                        raise error
+                    raise
+                except Exception as e:
+                    if streamed or not is_backend_failure(e):
+                        raise
+                    error = e
+        finally:
+            # Abandoned streams (client went away) count as errors too
+            _record_llm_call("stream", "ok" if final is not None else "error", started, final)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+llm_client = AsyncOllamaClient(cache=llm_cache, pool=llm_pool)
+
+async def aquery_llm(prompt, model="llama3"):
+    """Async counterpart of query_llm, used by the FastAPI handlers."""
+    return await llm_client.generate(prompt, model=model)
+
+async def astream_llm(prompt, model="llama3"):
+    """Stream tokens from Ollama; raises on connection or HTTP errors.
+
+    A cached answer is replayed as a single token; a fresh one is cached once complete.
+    """
+    key = cache_key(model, prompt)
+    cached = await llm_cache.aget(key)
+    if cached is not None:
+        LLM_CACHE_HITS.inc()
+        yield cached
+        return
+
+    tokens = []
+    async for token in llm_client.stream(prompt, model=model):
+        tokens.append(token)
+        yield token
+    await llm_cache.aput(key, "".join(tokens).strip())
@@ -0,0 +1,155 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+ERROR_PREFIX = "Error querying Ollama"
+
+DEFAULT_MAX_ENTRIES = 2048
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def cache_key(model: str, prompt: str, options: Optional[Dict[str, Any]] = None) -> str:
+    payload = json.dumps({"model": model, "prompt": prompt, "options": options or {}}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def is_cacheable(response: Optional[str]) -> bool:
+    """Empty answers and error strings must never be served from cache."""
+    return bool(response) and not response.startswith(ERROR_PREFIX)
+
+
+class LLMCache:
+    """Two-tier response cache: size-bounded in-memory LRU over optional SQLite on disk.
+
+    enabled=False turns every lookup into a miss and every store into a no-op.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_bytes: int = DEFAULT_MAX_BYTES, disk_path: Optional[str] = None,
+                 enabled: bool = True):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        # SQLite I/O has its own lock so a slow disk read never holds up memory-tier lookups
+        self._disk_lock = threading.Lock()
+        self._counters = {"hits": 0, "memory_hits": 0, "disk_hits": 0,
+                          "misses": 0, "stores": 0, "evictions": 0}
+
+        self._disk: Optional[sqlite3.Connection] = None
+        if disk_path:
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache "
+                "(key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._disk.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            response = self._get_memory(key)
+        if response is None and self._disk is not None:
+            response = self._get_disk(key)
+        if response is None:
+            with self._lock:
+                self._counters["misses"] += 1
+        return response
+
+    async def aget(self, key: str) -> Optional[str]:
+        """get() for async handlers: memory hits answer inline, the disk tier is read in a worker thread."""
+        if not self.enabled or self._disk is None:
+            return self.get(key)
+        with self._lock:
+            response = self._get_memory(key)
+        if response is not None:
+            return response
+        return await asyncio.to_thread(self.get, key)
+
+    def put(self, key: str, response: str) -> None:
+        if not self.enabled or not is_cacheable(response):
+            return
+        with self._lock:
+            self._remember(key, response)
+            self._counters["stores"] += 1
+        if self._disk is not None:
+            with self._disk_lock:
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, response, created_at) VALUES (?, ?, ?)",
+                    (key, response, time.time()),
+                )
+                self._disk.commit()
+
+    async def aput(self, key: str, response: str) -> None:
+        """put() for async handlers; the SQLite write runs in a worker thread."""
+        if self._disk is None:
+            self.put(key, response)
+        else:
+            await asyncio.to_thread(self.put, key, response)
+
+    def _get_memory(self, key: str) -> Optional[str]:
+        """Caller holds the lock."""
+        response = self._memory.get(key)
+        if response is not None:
+            self._memory.move_to_end(key)
+            self._counters["hits"] += 1
+            self._counters["memory_hits"] += 1
+        return response
+
+    def _get_disk(self, key: str) -> Optional[str]:
+        with self._disk_lock:
+            row = self._disk.execute(
+                "SELECT response FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        with self._lock:
+            # Promote to the memory tier
+            self._remember(key, row[0])
+            self._counters["hits"] += 1
+            self._counters["disk_hits"] += 1
+        return row[0]
+
+    def _remember(self, key: str, response: str) -> None:
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old.encode("utf-8"))
+        self._memory[key] = response
+        self._memory_bytes += size
+
+        while len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted.encode("utf-8"))
+            self._counters["evictions"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+        if self._disk is not None:
+            with self._disk_lock:
+                self._disk.execute("DELETE FROM llm_cache")
+                self._disk.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {
+                "enabled": self.enabled,
+                **self._counters,
+                "hit_rate": round(self._counters["hits"] / lookups, 3) if lookups else 0.0,
+                "entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_tier": self._disk is not None,
+            }
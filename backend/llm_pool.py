@@ -0,0 +1,220 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import httpx
+import requests
+
+# Background health probe: GET /api/tags lists the local models without loading one
+LLM_HEALTH_INTERVAL_SECONDS = float(os.getenv("LLM_HEALTH_INTERVAL_SECONDS", "10"))
+LLM_HEALTH_TIMEOUT = 2.0
+
+# Consecutive failed requests that open a backend's circuit, and how long it stays open
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "3"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class NoBackendAvailable(RuntimeError):
+    pass
+
+
+def probe_url(api_url: str) -> str:
+    """The /api/tags URL on the same server as a /api/generate URL."""
+    base = api_url.split("/api/", 1)[0] if "/api/" in api_url else api_url.rstrip("/")
+    return f"{base}/api/tags"
+
+
+def is_backend_failure(error: BaseException) -> bool:
+    """Connect errors, timeouts and 5xx responses; a 4xx is the request's fault, not the server's."""
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    if status is not None:
+        return status >= 500
+    return isinstance(error, (httpx.TransportError, requests.ConnectionError, requests.Timeout))
+
+
+class LLMBackend:
+    """One Ollama server: requests in flight, probe result and circuit breaker."""
+
+    def __init__(self, url: str, max_concurrency: int, failure_threshold: int, reset_seconds: float):
+        self.url = url
+        self.probe_url = probe_url(url)
+        # Requests beyond the limit wait here instead of piling onto this server
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+
+        # Assumed healthy until the first probe says otherwise
+        self.healthy = True
+        self.probe_ms: Optional[float] = None
+        self.probe_error: Optional[str] = None
+        self.last_probe: Optional[float] = None
+
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+
+    def up(self, now: float) -> bool:
+        """Passing health probes and not inside an open circuit's reset window."""
+        return self.healthy and (self.state != OPEN or now - self.opened_at >= self.reset_seconds)
+
+    def available(self, now: float) -> bool:
+        """Whether a new request may be routed here; caller holds the pool lock."""
+        if not self.up(now):
+            return False
+        if self.state == OPEN:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            # A single trial request decides whether the circuit closes again
+            return self.outstanding == 0
+        return True
+
+    def record(self, ok: bool, now: float) -> None:
+        self.requests += 1
+        if ok:
+            self.consecutive_failures = 0
+            if self.state != CLOSED:
+                print(f"LLM backend {self.url} recovered, circuit closed")
+            self.state = CLOSED
+            return
+
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.consecutive_failures >= self.failure_threshold):
+            print(f"LLM backend {self.url} failing, circuit open for {self.reset_seconds:.0f}s")
+            self.state = OPEN
+            self.opened_at = now
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "circuit": self.state,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "probe_ms": self.probe_ms,
+            "probe_error": self.probe_error,
+            "last_probe_age_seconds": round(time.monotonic() - self.last_probe, 1) if self.last_probe else None,
+        }
+
+
+class LLMBackendPool:
+    """Ollama servers behind least-outstanding-requests routing.
+
+    Each request goes to the available backend with the fewest requests in
+    flight (ties broken at random). A backend is skipped while its last
+    background probe failed or while its circuit is open after repeated
+    request failures; once the reset time passes, one trial request is let
+    through to decide whether it closes again. Sync and async callers share
+    the pool, so routing state sits behind a thread lock.
+    """
+
+    def __init__(
+        self,
+        urls: Sequence[str],
+        max_concurrency: int,
+        failure_threshold: int = LLM_BREAKER_FAILURES,
+        reset_seconds: float = LLM_BREAKER_RESET_SECONDS,
+        health_interval: float = LLM_HEALTH_INTERVAL_SECONDS,
+    ):
+        if not urls:
+            raise ValueError("LLMBackendPool needs at least one backend URL")
+        self.backends = [LLMBackend(url, max_concurrency, failure_threshold, reset_seconds) for url in urls]
+        self.health_interval = health_interval
+        self._lock = threading.Lock()
+        self._probe_task: Optional[asyncio.Task] = None
+
+    def acquire(self, exclude: Sequence[LLMBackend] = ()) -> LLMBackend:
+        with self._lock:
+            now = time.monotonic()
+            candidates = [b for b in self.backends if b not in exclude and b.available(now)]
+            if not candidates:
+                raise NoBackendAvailable("No healthy LLM backend available")
+            fewest = min(b.outstanding for b in candidates)
+            backend = random.choice([b for b in candidates if b.outstanding == fewest])
+            backend.outstanding += 1
+            return backend
+
+    def release(self, backend: LLMBackend, ok: Optional[bool]) -> None:
+        """ok=None (cancelled, client went away) says nothing about the backend."""
+        with self._lock:
+            backend.outstanding -= 1
+            if ok is not None:
+                backend.record(ok, time.monotonic())
+
+    @contextmanager
+    def lease(self, exclude: Sequence[LLMBackend] = ()) -> Iterator[LLMBackend]:
+        """Route one request; only backend failures raised inside the block count against its circuit."""
+        backend = self.acquire(exclude)
+        ok: Optional[bool] = None
+        try:
+            yield backend
+            ok = True
+        except Exception as e:
+            ok = False if is_backend_failure(e) else None
+            raise
+        finally:
+            self.release(backend, ok)
+
+    # ----- health probing -----
+    async def probe(self, client: httpx.AsyncClient) -> None:
+        async def check(backend: LLMBackend):
+            started = time.perf_counter()
+            try:
+                response = await client.get(backend.probe_url, timeout=LLM_HEALTH_TIMEOUT)
+                response.raise_for_status()
+                error = None
+            except Exception as e:
+                error = str(e) or type(e).__name__
+            with self._lock:
+                if error and backend.healthy:
+                    print(f"LLM backend {backend.url} failed its health probe: {error}")
+                backend.healthy = error is None
+                backend.probe_error = error
+                backend.probe_ms = round((time.perf_counter() - started) * 1000, 1)
+                backend.last_probe = time.monotonic()
+
+        await asyncio.gather(*(check(backend) for backend in self.backends))
+
+    async def run_health_checks(self) -> None:
+        async with httpx.AsyncClient() as client:
+            while True:
+                await self.probe(client)
+                await asyncio.sleep(self.health_interval)
+
+    def start(self) -> None:
+        if self._probe_task is None:
+            self._probe_task = asyncio.create_task(self.run_health_checks())
+
+    async def stop(self) -> None:
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            await asyncio.gather(self._probe_task, return_exceptions=True)
+            self._probe_task = None
+
+    def available_count(self) -> int:
+        with self._lock:
+            now = time.monotonic()
+            return sum(1 for backend in self.backends if backend.up(now))
+
+    def stats(self) -> Dict[str, Any]:
+        """Cached view of every backend; never contacts a server."""
+        backends: List[Dict[str, Any]] = [backend.stats() for backend in self.backends]
+        return {
+            "routing": "least_outstanding",
+            "available": self.available_count(),
+            "total": len(self.backends),
+            "backends": backends,
+        }
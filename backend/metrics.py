@@ -0,0 +1,274 @@
+import bisect
+import contextvars
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Seconds; spans everything from a cached lookup to a long LLM generation
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Completed request traces kept for /traces
+TRACE_HISTORY = 200
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric(ABC):
+    """Base for labelled metrics; one child per distinct label value tuple."""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    @abstractmethod
+    def _new_child(self):
+        ...
+
+    def labels(self, *values: Any):
+        key = tuple(str(value) for value in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    @abstractmethod
+    def _samples(self) -> Iterator[str]:
+        ...
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def _samples(self):
+        for key, child in list(self._children.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"
+
+
+class _GaugeChild:
+    def __init__(self):
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Read the value from function at scrape time instead of storing it."""
+        self.function = function
+
+    def get(self) -> float:
+        return self.function() if self.function is not None else self.value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self.labels().set_function(function)
+
+    def _samples(self):
+        for key, child in list(self._children.items()):
+            try:
+                value = child.get()
+            except Exception:
+                continue
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class _HistogramChild:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def _samples(self):
+        for key, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(child.sum)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}"
+
+
+REGISTRY: List[_Metric] = []
+
+
+def render_metrics() -> str:
+    """Every registered metric in the Prometheus text exposition format."""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+# ----- metrics shared across modules -----
+STAGE_SECONDS = Histogram(
+    "pdf_stage_seconds", "Time spent in each processing stage", ["stage"])
+HTTP_REQUEST_SECONDS = Histogram(
+    "pdf_http_request_seconds", "HTTP request latency", ["method", "route", "status"])
+LLM_REQUEST_SECONDS = Histogram(
+    "pdf_llm_request_seconds", "Ollama call latency", ["mode", "outcome"])
+LLM_TOKENS = Counter(
+    "pdf_llm_tokens_total", "Tokens processed by Ollama", ["kind"])
+LLM_CACHE_HITS = Counter(
+    "pdf_llm_cache_hits_total", "LLM calls answered from the response cache")
+QUEUE_DEPTH = Gauge(
+    "pdf_queue_depth", "Items waiting in internal queues", ["queue"])
+SESSION_MEMORY_BYTES = Gauge(
+    "pdf_session_memory_bytes", "Resident session memory and its budget", ["kind"])
+SESSIONS = Gauge(
+    "pdf_sessions", "Sessions held by this worker", ["state"])
+LLM_BACKEND_UP = Gauge(
+    "pdf_llm_backend_up", "1 while an Ollama backend passes probes and its circuit is not open", ["backend"])
+LLM_BACKEND_OUTSTANDING = Gauge(
+    "pdf_llm_backend_outstanding", "Requests in flight per Ollama backend", ["backend"])
+
+
+# ----- request tracing -----
+_current_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("trace", default=None)
+recent_traces: Deque[Dict[str, Any]] = deque(maxlen=TRACE_HISTORY)
+
+
+class Trace:
+    """Spans recorded while serving one request, tagged with its trace id."""
+
+    def __init__(self, trace_id: Optional[str] = None, name: str = ""):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, start: float, seconds: float) -> None:
+        with self._lock:
+            self.spans.append({
+                "name": name,
+                "offset_ms": round(1000 * (start - self.started), 2),
+                "duration_ms": round(1000 * seconds, 2),
+            })
+
+    def as_dict(self, status: int, seconds: float) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "request": self.name,
+            "status": status,
+            "duration_ms": round(1000 * seconds, 2),
+            "spans": sorted(self.spans, key=lambda span: span["offset_ms"]),
+        }
+
+
+def start_trace(trace_id: Optional[str] = None, name: str = "") -> Tuple[Trace, contextvars.Token]:
+    trace = Trace(trace_id, name)
+    return trace, _current_trace.set(trace)
+
+
+def detach_trace(token: contextvars.Token) -> None:
+    """Stop attaching new spans in this context; tasks started meanwhile keep the trace."""
+    _current_trace.reset(token)
+
+
+def finish_trace(trace: Trace, status: int) -> Dict[str, Any]:
+    record = trace.as_dict(status, time.perf_counter() - trace.started)
+    recent_traces.append(record)
+    return record
+
+
+def record_span(name: str, start: float, seconds: float) -> None:
+    """Attach a finished span to the request being served, if any."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_span(name, start, seconds)
+
+
+@contextmanager
+def span(name: str, histogram: Optional[Histogram] = None, *labels: str) -> Iterator[None]:
+    """Time a block into the current trace and, optionally, a histogram."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        if histogram is not None:
+            histogram.labels(*labels).observe(seconds)
+        record_span(name, start, seconds)
+
+
+def stage_timer(stage: str):
+    """Time a processing stage (parse, chunk, embed, index, search)."""
+    return span(stage, STAGE_SECONDS, stage)
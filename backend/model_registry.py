@@ -0,0 +1,74 @@
+import itertools
+import threading
+import time
+from typing import Any, Dict
+
+from sentence_transformers import SentenceTransformer
+
+DEFAULT_MODEL_NAME = "all-MiniLM-L6-v2"
+
+
+def _model_memory_bytes(model: SentenceTransformer) -> int:
+    """Approximate resident size of a model's weights and buffers."""
+    total = 0
+    for tensor in itertools.chain(model.parameters(), model.buffers()):
+        total += tensor.numel() * tensor.element_size()
+    return total
+
+
+class ModelRegistry:
+    """Process-wide cache so each embedding model is loaded only once."""
+
+    def __init__(self):
+        self._models: Dict[str, SentenceTransformer] = {}
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_name: str = DEFAULT_MODEL_NAME) -> SentenceTransformer:
+        """Return the shared model instance, loading it on first use."""
+        model = self._models.get(model_name)
+        if model is not None:
+            return model
+
+        with self._lock:
+            # Another thread may have finished loading while we waited
+            model = self._models.get(model_name)
+            if model is None:
+                start = time.perf_counter()
+                model = SentenceTransformer(model_name)
+                load_seconds = time.perf_counter() - start
+                memory_bytes = _model_memory_bytes(model)
+
+                self._models[model_name] = model
+                self._stats[model_name] = {
+                    "load_seconds": round(load_seconds, 3),
+                    "memory_bytes": memory_bytes,
+                    "memory_mb": round(memory_bytes / (1024 * 1024), 1),
+                    "dimension": model.get_sentence_embedding_dimension(),
+                }
+                print(f"Loaded model {model_name} in {load_seconds:.2f}s "
+                      f"({memory_bytes / (1024 * 1024):.1f} MB)")
+        return model
+
+    def register(self, model_name: str, model: Any) -> None:
+        """Use an already constructed model (e.g. an offline stub) under model_name."""
+        with self._lock:
+            self._models[model_name] = model
+            self._stats[model_name] = {
+                "load_seconds": 0.0,
+                "memory_bytes": 0,
+                "memory_mb": 0.0,
+                "dimension": model.get_sentence_embedding_dimension(),
+            }
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Load time and memory usage for every loaded model."""
+        return {name: dict(info) for name, info in self._stats.items()}
+
+
+model_registry = ModelRegistry()
+
+
+def get_model(model_name: str = DEFAULT_MODEL_NAME) -> SentenceTransformer:
+    """Shortcut for the process-wide registry."""
+    return model_registry.get(model_name)
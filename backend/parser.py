@@ -1,45 +1,105 @@
+import bisect
 import fitz  # PyMuPDF
+import os
 import re
-from typing import List
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
 
-def parse_pdf(file_path: str) -> str:
-    """Extract text from PDF with better structure preservation and error handling."""
+from metrics import stage_timer
+
+# Below this many pages a process pool costs more than it saves
+PARALLEL_MIN_PAGES = 64
+SHARDS_PER_WORKER = 4
+
+def _page_marker(page_num: int) -> str:
+    return f"\n\n--- PAGE {page_num + 1} ---\n\n"
+
+def _extract_page_text(page) -> str:
+    """Extract one page, falling back to the 'dict' method for sparse pages."""
+    page_text = page.get_text("text")
+    
+    # If no text found, try different extraction method
+    if not page_text or len(page_text.strip()) < 10:
+        blocks = page.get_text("dict")
+        page_text = "".join(
+            span.get("text", "") + " "
+            for block in blocks.get("blocks", [])
+            if "lines" in block
+            for line in block["lines"]
+            for span in line.get("spans", [])
+        )
+    
+    return page_text
+
+def _iter_page_range(file_path: str, start: int, end: int) -> Iterator[str]:
+    """Yield pages [start, end) as ordered text pieces, page markers included."""
+    doc = fitz.open(file_path)
     try:
-        doc = fitz.open(file_path)
-        text = ""
-        
-        print(f"PDF has {doc.page_count} pages")
-        
-        for page_num, page in enumerate(doc):
+        for page_num in range(start, end):
             try:
-                # Get text with layout info
-                page_text = page.get_text("text")
-                
-                # If no text found, try different extraction method
-                if not page_text or len(page_text.strip()) < 10:
-                    print(f"Page {page_num + 1}: No text found, trying 'dict' method")
-                    # Try dict method for better text extraction
-                    blocks = page.get_text("dict")
-                    page_text = ""
-                    for block in blocks.get("blocks", []):
-                        if "lines" in block:
-                            for line in block["lines"]:
-                                for span in line.get("spans", []):
-                                    page_text += span.get("text", "") + " "
+                page_text = _extract_page_text(doc[page_num])
                 
                 # Add page markers for better chunking
-                if page_num > 0:
-                    text += f"\n\n--- PAGE {page_num + 1} ---\n\n"
-                
-                text += page_text if page_text else f"[Page {page_num + 1} - No extractable text]"
-                
-                print(f"Page {page_num + 1}: Extracted {len(page_text)} characters")
-                
+                marker = _page_marker(page_num) if page_num > 0 else ""
+                piece = marker + (page_text if page_text else f"[Page {page_num + 1} - No extractable text]")
             except Exception as page_error:
                 print(f"Error processing page {page_num + 1}: {page_error}")
-                text += f"\n\n--- PAGE {page_num + 1} ---\n\n[Error extracting text from this page]\n\n"
-        
+                piece = _page_marker(page_num) + "[Error extracting text from this page]\n\n"
+            yield piece
+    finally:
         doc.close()
+
+def _extract_page_range(file_path: str, start: int, end: int) -> List[str]:
+    """Process-pool entry point: a whole shard of page pieces."""
+    return list(_iter_page_range(file_path, start, end))
+
+def _page_shards(page_count: int, workers: int) -> List[Tuple[int, int]]:
+    shard_count = min(page_count, workers * SHARDS_PER_WORKER)
+    shard_size = -(-page_count // shard_count)
+    return [(start, min(start + shard_size, page_count)) for start in range(0, page_count, shard_size)]
+
+def pdf_page_count(file_path: str) -> int:
+    with fitz.open(file_path) as doc:
+        return doc.page_count
+
+def iter_pdf_pages(file_path: str, workers: Optional[int] = None,
+                   page_count: Optional[int] = None) -> Iterator[str]:
+    """Yield page text pieces in order, page markers included.
+    
+    workers=1 forces single-process extraction; None picks a process pool
+    for large documents. Each worker opens its own fitz document.
+    """
+    if page_count is None:
+        page_count = pdf_page_count(file_path)
+    
+    if workers is None:
+        workers = (os.cpu_count() or 1) if page_count >= PARALLEL_MIN_PAGES else 1
+    
+    if workers > 1 and page_count > 1:
+        shards = _page_shards(page_count, workers)
+        pool = ProcessPoolExecutor(max_workers=min(workers, len(shards)))
+        try:
+            # map() yields shards in submission order as soon as each is ready
+            results = pool.map(_extract_page_range, [file_path] * len(shards),
+                               [start for start, _ in shards], [end for _, end in shards])
+            for shard_pieces in results:
+                yield from shard_pieces
+        finally:
+            # Closing the generator early (e.g. a cancelled ingest) skips unstarted shards
+            pool.shutdown(wait=True, cancel_futures=True)
+    else:
+        # Single process: open once and stream page by page
+        yield from _iter_page_range(file_path, 0, page_count)
+
+def parse_pdf(file_path: str, workers: Optional[int] = None) -> str:
+    """Extract text from PDF with better structure preservation and error handling."""
+    try:
+        page_count = pdf_page_count(file_path)
+        
+        print(f"PDF has {page_count} pages")
+        
+        with stage_timer("parse"):
+            text = "".join(iter_pdf_pages(file_path, workers=workers, page_count=page_count))
         
         # Final validation
         if not text or text.isspace():
@@ -64,69 +124,196 @@ def chunk_text(text, chunk_size=1000, overlap=100):
         start += chunk_size - overlap
     return chunks
 
-def smart_chunk_text(text: str, chunk_size: int = 1200, overlap: int = 200) -> List[str]:
-    """Enhanced chunking that respects document structure."""
+class ChunkSpan(NamedTuple):
+    """A chunk as [start, end) offsets into the concatenated text, and the page it starts on."""
+    start: int
+    end: int
+    page: int
+
+# Paragraph breaks; page markers are breaks that also move the current page
+_SEPARATOR = re.compile(r'\n\n+(?:--- PAGE (\d+) ---\n\n)?')
+_SENTENCE_ENDS = (". ", ".\n", "! ", "!\n", "? ", "?\n")
+# Shorter chunks are dropped
+MIN_CHUNK_CHARS = 50
+# Part of the index store key; bump whenever chunk boundaries or chunk text change
+CHUNKER_VERSION = 2
+
+class SpanChunker:
+    """Single-pass chunker that tracks offsets instead of building strings.
     
-    # First, split by major sections (headers, page breaks)
-    major_sections = re.split(r'\n\n--- PAGE \d+ ---\n\n|\n\n(?=[A-Z][A-Z\s]{10,})\n', text)
+    feed() takes text pieces (pages) in order and returns the chunks completed
+    so far as ChunkSpans into the text of all pieces joined together. Chunks
+    are packed from whole paragraphs, then sentences, then words, never exceed
+    chunk_size, and start with up to overlap characters of the previous chunk.
+    Long paragraphs are cut with a few rfind() calls per chunk rather than
+    split into sentences, so the work stays linear in the text length.
+    Page markers stay inside the spans but are cut out of text(span), which
+    puts a paragraph break in their place. Only the tail of the text an open
+    chunk still needs is kept, so text(span) is valid until the next feed().
+    """
     
-    chunks = []
-    current_chunk = ""
+    def __init__(self, chunk_size: int = 1200, overlap: int = 200):
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self._buf = ""
+        self._base = 0  # offset of _buf[0] in the joined text
+        self._start: Optional[int] = None  # open chunk
+        self._end = 0
+        self._page_starts: List[int] = [0]
+        self._page_numbers: List[int] = [1]
+        # [start, end) of every page marker separator, in text order
+        self._marker_starts: List[int] = []
+        self._marker_ends: List[int] = []
+        self._ready: List[ChunkSpan] = []
     
-    for section in major_sections:
-        # Split section into paragraphs
-        paragraphs = section.split('\n\n')
+    def feed(self, piece: str) -> List[ChunkSpan]:
+        # Drop text no open chunk can reach any more
+        keep = self._start if self._start is not None else self._base + len(self._buf)
+        if keep > self._base:
+            self._buf = self._buf[keep - self._base:]
+            self._base = keep
+        offset = self._base + len(self._buf)
+        self._buf += piece
         
-        for paragraph in paragraphs:
-            paragraph = paragraph.strip()
-            if not paragraph:
-                continue
-            
-            # If adding this paragraph would exceed chunk size
-            if len(current_chunk) + len(paragraph) > chunk_size:
-                if current_chunk:
-                    chunks.append(current_chunk.strip())
-                    
-                    # Start new chunk with overlap
-                    overlap_text = current_chunk[-overlap:] if len(current_chunk) > overlap else current_chunk
-                    current_chunk = overlap_text + "\n\n" + paragraph
-                else:
-                    # Paragraph itself is too long, split it
-                    chunks.extend(_split_long_paragraph(paragraph, chunk_size, overlap))
-                    current_chunk = ""
+        pos = 0
+        for match in _SEPARATOR.finditer(piece):
+            self._add_paragraph(offset + pos, offset + match.start())
+            pos = match.end()
+            if match.group(1):
+                self._page_starts.append(offset + pos)
+                self._page_numbers.append(int(match.group(1)))
+                self._marker_starts.append(offset + match.start())
+                self._marker_ends.append(offset + pos)
+        self._add_paragraph(offset + pos, offset + len(piece))
+        return self._take()
+    
+    def finish(self) -> List[ChunkSpan]:
+        if self._start is not None:
+            self._emit()
+            self._start = None
+        return self._take()
+    
+    def text(self, span: ChunkSpan) -> str:
+        base = self._base
+        first = bisect.bisect_left(self._marker_starts, span.start)
+        last = bisect.bisect_left(self._marker_starts, span.end)
+        if first == last:
+            return self._buf[span.start - base:span.end - base]
+        parts = []
+        pos = span.start
+        for start, end in zip(self._marker_starts[first:last], self._marker_ends[first:last]):
+            parts.append(self._buf[pos - base:start - base])
+            pos = end
+        parts.append(self._buf[pos - base:span.end - base])
+        return "\n\n".join(parts)
+    
+    def _take(self) -> List[ChunkSpan]:
+        ready, self._ready = self._ready, []
+        return ready
+    
+    def _strip(self, start: int, end: int) -> Tuple[int, int]:
+        buf, base = self._buf, self._base
+        while start < end and buf[start - base].isspace():
+            start += 1
+        while end > start and buf[end - 1 - base].isspace():
+            end -= 1
+        return start, end
+    
+    def _add_paragraph(self, start: int, end: int):
+        start, end = self._strip(start, end)
+        if start >= end:
+            return
+        if self._start is not None and end - self._start <= self.chunk_size:
+            self._end = end
+        elif end - start <= self.chunk_size:
+            if self._start is not None:
+                self._emit()
+                overlap_start = self._overlap_start()
+                # Drop the overlap rather than exceed the chunk size
+                if overlap_start is not None and end - overlap_start <= self.chunk_size:
+                    start = overlap_start
+            self._start, self._end = start, end
+        else:
+            self._add_long_paragraph(start, end)
+    
+    def _add_long_paragraph(self, start: int, end: int):
+        """Fill chunks up to the last sentence end that fits, else the last whitespace."""
+        if self._start is None:
+            self._start = self._end = start
+        pos = start  # paragraph text not yet in any chunk
+        while end - self._start > self.chunk_size:
+            limit = self._start + self.chunk_size
+            cut = self._sentence_cut(pos, limit)
+            if cut is None and self._end == self._start:
+                # A single sentence longer than a chunk
+                cut = self._word_cut(pos, limit)
+            if cut is not None:
+                self._end = self._strip(self._start, cut)[1]
+                pos = self._strip(cut, end)[0]
+            self._emit()
+            overlap_start = self._overlap_start()
+            if overlap_start is not None and overlap_start > self._start:
+                self._start = overlap_start
             else:
-                current_chunk += "\n\n" + paragraph if current_chunk else paragraph
+                self._start = self._end = pos
+        self._end = end
+    
+    def _sentence_cut(self, start: int, limit: int) -> Optional[int]:
+        """Offset just past the last '.', '!' or '?' followed by a space or newline in [start, limit]."""
+        buf, base = self._buf, self._base
+        lo, hi = start - base, limit - base + 1
+        best = max(buf.rfind(end, lo, hi) for end in _SENTENCE_ENDS)
+        return best + base + 1 if best >= 0 else None
     
-    # Add the last chunk
-    if current_chunk:
-        chunks.append(current_chunk.strip())
+    def _word_cut(self, start: int, limit: int) -> int:
+        buf, base = self._buf, self._base
+        cut = max(buf.rfind(" ", start - base, limit - base), buf.rfind("\n", start - base, limit - base))
+        return cut + base if cut > start - base else limit
     
-    return [chunk for chunk in chunks if len(chunk.strip()) > 50]  # Filter out tiny chunks
+    def _overlap_start(self) -> Optional[int]:
+        """Start of the last `overlap` characters of the open chunk, moved up to a word start."""
+        start = max(self._start, self._end - self.overlap)
+        if start > self._start:
+            while start < self._end and not self._buf[start - 1 - self._base].isspace():
+                start += 1
+        # Never start a chunk partway through a page marker
+        marker = bisect.bisect_right(self._marker_starts, start) - 1
+        if marker >= 0 and start < self._marker_ends[marker]:
+            start = self._marker_ends[marker]
+        return start if start < self._end else None
+    
+    def _emit(self):
+        if self._end - self._start > MIN_CHUNK_CHARS:
+            page = self._page_numbers[bisect.bisect_right(self._page_starts, self._start) - 1]
+            self._ready.append(ChunkSpan(self._start, self._end, page))
+
+def chunk_spans(text: str, chunk_size: int = 1200, overlap: int = 200) -> List[ChunkSpan]:
+    """Chunk one text without copying it: spans index straight into text, page markers included."""
+    chunker = SpanChunker(chunk_size, overlap)
+    return chunker.feed(text) + chunker.finish()
+
+def iter_chunk_spans(pieces: Iterable[str], chunk_size: int = 1200,
+                     overlap: int = 200) -> Iterator[Tuple[ChunkSpan, str]]:
+    """Consume text pieces (e.g. pages), yield (span, chunk text) as chunks fill."""
+    chunker = SpanChunker(chunk_size, overlap)
+    for piece in pieces:
+        for chunk_span in chunker.feed(piece):
+            yield chunk_span, chunker.text(chunk_span)
+    for chunk_span in chunker.finish():
+        yield chunk_span, chunker.text(chunk_span)
+
+def smart_chunk_text(text: str, chunk_size: int = 1200, overlap: int = 200) -> List[str]:
+    """Enhanced chunking that respects document structure."""
+    with stage_timer("chunk"):
+        chunker = SpanChunker(chunk_size, overlap)
+        return [chunker.text(s) for s in chunker.feed(text) + chunker.finish()]
+
+def iter_smart_chunks(pieces: Iterable[str], chunk_size: int = 1200, overlap: int = 200) -> Iterator[str]:
+    """Incremental smart_chunk_text: consume text pieces (e.g. pages), yield chunks as they fill."""
+    for _, chunk in iter_chunk_spans(pieces, chunk_size, overlap):
+        yield chunk
 
 def _split_long_paragraph(paragraph: str, chunk_size: int, overlap: int) -> List[str]:
     """Split a long paragraph into smaller chunks."""
-    sentences = re.split(r'[.!?]+\s+', paragraph)
-    chunks = []
-    current_chunk = ""
-    
-    for sentence in sentences:
-        if len(current_chunk) + len(sentence) > chunk_size:
-            if current_chunk:
-                chunks.append(current_chunk.strip())
-                # Add overlap from previous chunk
-                overlap_text = current_chunk[-overlap:] if len(current_chunk) > overlap else current_chunk
-                current_chunk = overlap_text + " " + sentence
-            else:
-                # Even single sentence is too long, force split
-                words = sentence.split()
-                for i in range(0, len(words), chunk_size//10):
-                    chunk_words = words[i:i + chunk_size//10]
-                    chunks.append(" ".join(chunk_words))
-                current_chunk = ""
-        else:
-            current_chunk += ". " + sentence if current_chunk else sentence
-    
-    if current_chunk:
-        chunks.append(current_chunk.strip())
-    
-    return chunks
\ No newline at end of file
+    chunker = SpanChunker(chunk_size, overlap)
+    return [chunker.text(s) for s in chunker.feed(paragraph) + chunker.finish()]
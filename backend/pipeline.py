@@ -0,0 +1,177 @@
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from embedder import OptimizedEmbedder
+from ingest_scheduler import IngestionCancelled
+from metrics import stage_timer
+from parser import iter_chunk_spans, iter_pdf_pages, pdf_page_count
+
+# Bounded hand-off queues keep each stage at most a few items ahead of the next
+PAGE_QUEUE_SIZE = 16
+CHUNK_QUEUE_SIZE = 128
+EMBED_BATCH_SIZE = 32
+
+_DONE = object()
+
+
+class IngestionProgress:
+    """Real counts of work done, shared between the pipeline stages."""
+
+    def __init__(self, page_count: int):
+        self.page_count = page_count
+        self.pages_done = 0
+        self.text_length = 0
+        self.chunks_produced = 0
+        self.chunks_embedded = 0
+        self.chunking_done = False
+
+    @property
+    def percent(self) -> int:
+        """Half the bar for parsing, half for embedding; 100 only once finished."""
+        parsed = self.pages_done / self.page_count if self.page_count else 1.0
+        embedded = self.chunks_embedded / self.chunks_produced if self.chunks_produced else 0.0
+        if not self.chunking_done:
+            # The chunk total is still growing, so embedding can't be complete yet
+            embedded = min(embedded, parsed)
+        return min(99, int(50 * parsed + 50 * embedded))
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "page_count": self.page_count,
+            "pages_done": self.pages_done,
+            "chunks_produced": self.chunks_produced,
+            "chunks_embedded": self.chunks_embedded,
+            "progress": self.percent,
+        }
+
+
+def _put(q: queue.Queue, item, stop: threading.Event):
+    """Blocking put that gives up once the pipeline is being torn down."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+
+def _drain(q: queue.Queue, stop: threading.Event,
+           cancel: Optional[threading.Event] = None) -> Iterator:
+    while not stop.is_set():
+        if cancel is not None and cancel.is_set():
+            return
+        try:
+            item = q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if item is _DONE:
+            return
+        yield item
+
+
+def ingest_pdf(
+    file_path: str,
+    embedder: OptimizedEmbedder,
+    chunk_size: int = 1200,
+    overlap: int = 200,
+    batch_size: int = EMBED_BATCH_SIZE,
+    on_progress: Optional[Callable[[str, IngestionProgress], None]] = None,
+    workers: Optional[int] = None,
+    cancel: Optional[threading.Event] = None,
+) -> Dict[str, Any]:
+    """Stream parse -> chunk -> embed with the three stages running concurrently.
+
+    Pages flow from the parser thread into the incremental chunker thread, and
+    chunks are embedded in batches on the calling thread as they arrive, so the
+    full text, all chunks and all embeddings are never held at once.
+    on_progress(stage, progress) is called after every page and batch.
+    Setting cancel stops all three stages and raises IngestionCancelled.
+    The result's chunk_pages holds the page each chunk starts on.
+    """
+    page_count = pdf_page_count(file_path)
+    progress = IngestionProgress(page_count)
+    page_q: queue.Queue = queue.Queue(maxsize=PAGE_QUEUE_SIZE)
+    chunk_q: queue.Queue = queue.Queue(maxsize=CHUNK_QUEUE_SIZE)
+    stop = threading.Event()
+    errors: List[BaseException] = []
+
+    def report(stage: str):
+        if on_progress is not None:
+            on_progress(stage, progress)
+
+    def cancelled() -> bool:
+        return cancel is not None and cancel.is_set()
+
+    def parse_stage():
+        pages = iter_pdf_pages(file_path, workers=workers, page_count=page_count)
+        try:
+            with stage_timer("parse"):
+                for piece in pages:
+                    if stop.is_set():
+                        return
+                    progress.pages_done += 1
+                    progress.text_length += len(piece)
+                    _put(page_q, piece, stop)
+                    report("parsing")
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            pages.close()
+            _put(page_q, _DONE, stop)
+
+    def chunk_stage():
+        try:
+            # Wall time of the stage, including waiting on the parser
+            with stage_timer("chunk"):
+                for chunk_span, chunk in iter_chunk_spans(_drain(page_q, stop), chunk_size, overlap):
+                    if stop.is_set():
+                        return
+                    progress.chunks_produced += 1
+                    _put(chunk_q, (chunk, chunk_span.page), stop)
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            progress.chunking_done = True
+            _put(chunk_q, _DONE, stop)
+
+    threads = [
+        threading.Thread(target=parse_stage, name="ingest-parse", daemon=True),
+        threading.Thread(target=chunk_stage, name="ingest-chunk", daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+
+    embedder.reset()
+    chunk_pages: List[int] = []
+    try:
+        batch: List[str] = []
+        for chunk, page in _drain(chunk_q, stop, cancel):
+            batch.append(chunk)
+            chunk_pages.append(page)
+            if len(batch) >= batch_size:
+                embedder.add_chunks(batch)
+                progress.chunks_embedded += len(batch)
+                batch = []
+                report("indexing")
+        if cancelled():
+            raise IngestionCancelled(file_path)
+        if batch:
+            embedder.add_chunks(batch)
+            progress.chunks_embedded += len(batch)
+            report("indexing")
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        raise errors[0]
+
+    embedder.finalize()
+    return {
+        "chunks": embedder.chunks,
+        "chunk_pages": chunk_pages,
+        "text_length": progress.text_length,
+        "page_count": page_count,
+    }
@@ -0,0 +1,131 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+from corpus_index import CorpusIndex
+from metrics import stage_timer
+from model_registry import DEFAULT_MODEL_NAME, get_model
+
+QUERY_BATCH_MAX_SIZE = 32
+QUERY_BATCH_WAIT_MS = 5.0
+
+
+class _PendingQuery:
+    def __init__(self, question: str, top_k: int, doc_ids: Optional[Tuple[str, ...]]):
+        self.question = question
+        self.top_k = top_k
+        self.doc_ids = doc_ids
+        self.future: Future = Future()
+
+
+class QueryBatcher:
+    """Micro-batch concurrent vector queries against the corpus index.
+
+    Queries arriving within max_wait_ms of the first one (up to
+    max_batch_size) are embedded in a single encode() call, and queries with
+    the same document scope share one index.search() call. Different scopes
+    get separate searches: one pass over the union of their documents would
+    score every query against every document in the batch, which costs more
+    than it saves when concurrent chats are on different sessions. stats()
+    reports how many searches each batch split into. Callers block on
+    search() from worker threads, as the retrievers already do.
+    """
+
+    def __init__(self, corpus: CorpusIndex, model_name: str = DEFAULT_MODEL_NAME,
+                 max_batch_size: int = QUERY_BATCH_MAX_SIZE, max_wait_ms: float = QUERY_BATCH_WAIT_MS):
+        self.corpus = corpus
+        self.model_name = model_name
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._queue: "queue.Queue[_PendingQuery]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._queries = 0
+        self._searches = 0
+        self._largest_batch = 0
+        self._wait_seconds = 0.0
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="query-batcher", daemon=True)
+                    self._thread.start()
+
+    def search(self, question: str, top_k: int = 5,
+               doc_ids: Optional[List[str]] = None) -> List[Tuple[str, int, float]]:
+        """Blocking (doc_id, chunk_index, score) search that rides along with concurrent queries."""
+        self._ensure_started()
+        pending = _PendingQuery(question, top_k, tuple(doc_ids) if doc_ids is not None else None)
+        enqueued = time.perf_counter()
+        self._queue.put(pending)
+        result = pending.future.result()
+        with self._stats_lock:
+            self._wait_seconds += time.perf_counter() - enqueued
+        return result
+
+    def _collect(self) -> List[_PendingQuery]:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._process(batch)
+            except Exception as e:
+                for pending in batch:
+                    if not pending.future.done():
+                        pending.future.set_exception(e)
+
+    def _process(self, batch: List[_PendingQuery]):
+        model = get_model(self.model_name)
+        with stage_timer("query_embed"):
+            vectors = model.encode([pending.question for pending in batch], convert_to_numpy=True)
+
+        # One search per distinct scope; k covers the largest request in the group
+        groups: Dict[Optional[Tuple[str, ...]], List[int]] = {}
+        for i, pending in enumerate(batch):
+            groups.setdefault(pending.doc_ids, []).append(i)
+
+        for doc_ids, members in groups.items():
+            k = max(batch[i].top_k for i in members)
+            results = self.corpus.search(vectors[members], k, doc_ids=doc_ids)
+            for i, hits in zip(members, results):
+                batch[i].future.set_result(hits[:batch[i].top_k])
+
+        with self._stats_lock:
+            self._batches += 1
+            self._queries += len(batch)
+            self._searches += len(groups)
+            self._largest_batch = max(self._largest_batch, len(batch))
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms,
+                "batches": self._batches,
+                "queries": self._queries,
+                "searches": self._searches,
+                "avg_searches_per_batch": round(self._searches / self._batches, 2) if self._batches else 0.0,
+                "avg_batch_size": round(self._queries / self._batches, 2) if self._batches else 0.0,
+                "largest_batch": self._largest_batch,
+                "avg_wait_ms": round(1000 * self._wait_seconds / self._queries, 2) if self._queries else 0.0,
+            }
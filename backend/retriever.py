@@ -1,22 +1,18 @@
+from context_builder import CONTEXT_TOKEN_BUDGET, build_context
 from embedder import OptimizedEmbedder
 from llm import query_llm
 
-def generate_answer(question: str, retriever: OptimizedEmbedder, max_context_length: int = 2000) -> str:
+def generate_answer(question: str, retriever: OptimizedEmbedder, token_budget: int = CONTEXT_TOKEN_BUDGET) -> str:
     """Generate answer using retrieved context."""
     
     # Get relevant chunks
-    relevant_chunks = retriever.query(question, top_k=5)
+    hits = retriever.query_hits(question, top_k=8)
     
-    if not relevant_chunks:
+    if not hits:
         return "I couldn't find relevant information in the document to answer your question."
     
-    # Combine chunks, respecting max context length
-    context = ""
-    for chunk in relevant_chunks:
-        if len(context) + len(chunk) <= max_context_length:
-            context += chunk + "\n\n"
-        else:
-            break
+    # Merge overlapping neighbours and pack by relevance, respecting the token budget
+    context = build_context(hits, retriever.chunks, token_budget)
     
     prompt = f"""Based on the following context from the document, answer the user's question accurately. If the answer is not in the context, say so.
 
@@ -0,0 +1,163 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+# "memory" keeps sessions inside this process; "sqlite" shares them between workers
+# but blocks the event loop on every session access, so it suits low traffic only
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+SESSION_DB_PATH = os.getenv(
+    "SESSION_DB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "sessions.db"),
+)
+
+
+class SessionBackend(ABC):
+    """Shared record of every session: status, progress and metadata as JSON.
+
+    Chunks and vectors are not stored here; records point at them through
+    their content_key in the IndexStore, which every worker can read.
+    """
+
+    @abstractmethod
+    def create(self, session_id: str, record: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    def update(self, session_id: str, record: Dict[str, Any]) -> bool:
+        """Replace an existing record; returns False if it was deleted meanwhile."""
+
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def delete(self, session_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def all(self) -> Dict[str, Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def touch(self, session_id: str, last_access: float) -> None:
+        ...
+
+    @abstractmethod
+    def idle_since(self, cutoff: float) -> List[str]:
+        """Sessions no worker has touched since cutoff."""
+
+
+class MemorySessionBackend(SessionBackend):
+    """Single-process backend; records only live as long as the worker."""
+
+    def __init__(self):
+        self._records: Dict[str, Dict[str, Any]] = {}
+        self._access: Dict[str, float] = {}
+
+    def create(self, session_id, record):
+        self._records[session_id] = dict(record)
+        self._access[session_id] = time.time()
+
+    def update(self, session_id, record):
+        if session_id not in self._records:
+            return False
+        self._records[session_id] = dict(record)
+        return True
+
+    def get(self, session_id):
+        record = self._records.get(session_id)
+        return dict(record) if record is not None else None
+
+    def delete(self, session_id):
+        self._access.pop(session_id, None)
+        return self._records.pop(session_id, None) is not None
+
+    def all(self):
+        return {session_id: dict(record) for session_id, record in self._records.items()}
+
+    def touch(self, session_id, last_access):
+        if session_id in self._records:
+            self._access[session_id] = max(last_access, self._access.get(session_id, 0.0))
+
+    def idle_since(self, cutoff):
+        return [session_id for session_id, last in self._access.items() if last < cutoff]
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """Session records in a SQLite file that every uvicorn worker opens.
+
+    WAL mode lets readers in other workers proceed while one worker writes.
+    SessionManager is a plain mapping, so each get, write-through and delete
+    from a request handler runs this SQLite I/O on the event loop. That is
+    fine for a handful of concurrent users; under real traffic a slow disk or
+    a writer holding the lock stalls every request in the worker.
+    """
+
+    def __init__(self, path: str = SESSION_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions "
+            "(id TEXT PRIMARY KEY, record TEXT NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def create(self, session_id, record):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions (id, record, last_access) VALUES (?, ?, ?)",
+                (session_id, json.dumps(record), time.time()),
+            )
+            self._db.commit()
+
+    def update(self, session_id, record):
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE sessions SET record = ? WHERE id = ?", (json.dumps(record), session_id)
+            )
+            self._db.commit()
+            return cursor.rowcount > 0
+
+    def get(self, session_id):
+        with self._lock:
+            row = self._db.execute("SELECT record FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def delete(self, session_id):
+        with self._lock:
+            cursor = self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self._db.commit()
+            return cursor.rowcount > 0
+
+    def all(self):
+        with self._lock:
+            rows = self._db.execute("SELECT id, record FROM sessions").fetchall()
+        return {session_id: json.loads(record) for session_id, record in rows}
+
+    def touch(self, session_id, last_access):
+        with self._lock:
+            self._db.execute(
+                "UPDATE sessions SET last_access = MAX(last_access, ?) WHERE id = ?",
+                (last_access, session_id),
+            )
+            self._db.commit()
+
+    def idle_since(self, cutoff):
+        with self._lock:
+            rows = self._db.execute("SELECT id FROM sessions WHERE last_access < ?", (cutoff,)).fetchall()
+        return [row[0] for row in rows]
+
+
+def get_session_backend(kind: str = SESSION_BACKEND) -> SessionBackend:
+    if kind == "sqlite":
+        return SQLiteSessionBackend()
+    if kind == "memory":
+        return MemorySessionBackend()
+    raise ValueError(f"Unknown SESSION_BACKEND '{kind}' (use 'memory' or 'sqlite')")
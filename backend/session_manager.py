@@ -0,0 +1,316 @@
+import asyncio
+import os
+import time
+from collections.abc import MutableMapping
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from corpus_index import CorpusIndex
+from index_store import IndexStore
+from session_backend import MemorySessionBackend, SessionBackend
+
+SESSION_MEMORY_BUDGET_MB = float(os.getenv("SESSION_MEMORY_BUDGET_MB", "1024"))
+SESSION_IDLE_TTL_SECONDS = float(os.getenv("SESSION_IDLE_TTL_SECONDS", "3600"))
+SESSION_SWEEP_INTERVAL_SECONDS = 60.0
+
+# A session used this recently may still be mid-query; never spill it
+MIN_RESIDENT_SECONDS = 30.0
+
+# Per-worker state that is never written to the shared backend
+LOCAL_FIELDS = frozenset({"retriever", "chunks", "spilled", "memory_bytes", "last_access", "owned"})
+
+# Ingestion progress changes every page; publish it at most this often
+PROGRESS_FIELDS = frozenset({"progress", "pipeline"})
+PROGRESS_PUBLISH_SECONDS = 0.5
+
+# How often a worker records activity in the backend for idle expiry
+TOUCH_INTERVAL_SECONDS = 30.0
+
+READY = "ready"
+ERROR = "error"
+
+
+class Session(dict):
+    """Session dict that writes its shared fields through to the backend."""
+
+    def __init__(self, manager: "SessionManager", session_id: str, fields: Dict[str, Any]):
+        super().__init__(fields)
+        self._manager = manager
+        self._session_id = session_id
+        self._published = 0.0
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        changed = key not in LOCAL_FIELDS and self.get(key) != value
+        super().__setitem__(key, value)
+        if changed:
+            self._publish(progress_only=key in PROGRESS_FIELDS)
+
+    def update(self, *args, **kwargs) -> None:
+        fields = dict(*args, **kwargs)
+        changed = [key for key, value in fields.items() if key not in LOCAL_FIELDS and self.get(key) != value]
+        super().update(fields)
+        if changed:
+            self._publish(progress_only=all(key in PROGRESS_FIELDS for key in changed))
+
+    def record(self) -> Dict[str, Any]:
+        return {key: value for key, value in self.items() if key not in LOCAL_FIELDS}
+
+    def _publish(self, progress_only: bool = False) -> None:
+        now = time.time()
+        if progress_only and now - self._published < PROGRESS_PUBLISH_SECONDS:
+            return
+        self._published = now
+        self._manager._publish(self._session_id, self)
+
+
+class SessionManager(MutableMapping):
+    """Drop-in replacement for the pdf_sessions dict with a memory budget.
+
+    Status and metadata are written through to a SessionBackend, so with a
+    shared backend any uvicorn worker can serve any session: sessions created
+    elsewhere are picked up from the backend and their vectors loaded from
+    the IndexStore on first use.
+
+    READY sessions are charged for their vectors, chunks and lexical index.
+    When the total exceeds the budget, the least recently used sessions are
+    spilled: their vectors are guaranteed to be in the IndexStore and then
+    dropped from the corpus index. ensure_resident() loads them back on the
+    next request. Sessions idle for longer than the TTL are removed entirely.
+    """
+
+    def __init__(
+        self,
+        corpus: CorpusIndex,
+        store: IndexStore,
+        make_retriever: Callable[[str], Any],
+        memory_budget_bytes: int = int(SESSION_MEMORY_BUDGET_MB * 1024 * 1024),
+        idle_ttl_seconds: float = SESSION_IDLE_TTL_SECONDS,
+        backend: Optional[SessionBackend] = None,
+        on_delete: Optional[Callable[[str], Any]] = None,
+    ):
+        self.corpus = corpus
+        self.store = store
+        self.make_retriever = make_retriever
+        self.memory_budget_bytes = memory_budget_bytes
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.backend = backend or MemorySessionBackend()
+        # Called with the session id whenever a session is dropped from this worker
+        self.on_delete = on_delete
+        self._sessions: Dict[str, Session] = {}
+        self._touched: Dict[str, float] = {}
+        self._load_lock = asyncio.Lock()
+        self.spills = 0
+        self.reloads = 0
+        self.expirations = 0
+
+    # ----- mapping protocol; reads count as access for LRU/TTL -----
+    def __getitem__(self, session_id: str) -> Session:
+        session = self._sessions.get(session_id)
+        if session is None or (not session["owned"] and session["status"] not in (READY, ERROR)):
+            # Created or still being ingested by another worker: read the shared record
+            record = self.backend.get(session_id)
+            if record is None:
+                self._drop_local(session_id)
+                raise KeyError(session_id)
+            session = self._adopt(session_id, record)
+
+        now = time.time()
+        session["last_access"] = now
+        if now - self._touched.get(session_id, 0.0) >= TOUCH_INTERVAL_SECONDS:
+            self._touched[session_id] = now
+            self.backend.touch(session_id, now)
+        return session
+
+    def __setitem__(self, session_id: str, session: Dict[str, Any]) -> None:
+        session = Session(self, session_id, session)
+        session.setdefault("last_access", time.time())
+        session.setdefault("memory_bytes", 0)
+        session.setdefault("spilled", False)
+        # Only the worker that created a session ingests it
+        session.setdefault("owned", True)
+        self._sessions[session_id] = session
+        self.backend.create(session_id, session.record())
+
+    def __delitem__(self, session_id: str) -> None:
+        deleted = self.backend.delete(session_id)
+        if not self._drop_local(session_id) and not deleted:
+            raise KeyError(session_id)
+
+    def __contains__(self, session_id: object) -> bool:
+        # The backend is authoritative: another worker may have deleted it
+        if self.backend.get(session_id) is not None:
+            return True
+        self._drop_local(session_id)
+        return False
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.backend.all())
+
+    def __len__(self) -> int:
+        return len(self.backend.all())
+
+    def items(self):
+        # Listing sessions must not refresh their LRU position
+        return [(session_id, self._adopt(session_id, record))
+                for session_id, record in self.backend.all().items()]
+
+    # ----- shared backend -----
+    def _adopt(self, session_id: str, record: Dict[str, Any]) -> Session:
+        """Create or refresh the local view of a session from its shared record."""
+        session = self._sessions.get(session_id)
+        if session is not None and session["owned"]:
+            return session
+        if session is None:
+            session = Session(self, session_id, {
+                "retriever": None, "chunks": None, "memory_bytes": 0,
+                "last_access": 0.0, "owned": False,
+            })
+            self._sessions[session_id] = session
+        # Bypass write-through, this is the backend's own data
+        dict.update(session, record)
+        # READY elsewhere but not loaded here yet: ensure_resident() loads it from the store
+        dict.__setitem__(session, "spilled",
+                         record.get("status") == READY and not self.corpus.has_document(session_id))
+        return session
+
+    def _publish(self, session_id: str, session: Session) -> None:
+        if self._sessions.get(session_id) is not session:
+            return
+        if not self.backend.update(session_id, session.record()):
+            # Deleted by another worker while we were working on it
+            self._drop_local(session_id)
+
+    def _drop_local(self, session_id: str) -> bool:
+        session = self._sessions.pop(session_id, None)
+        self._touched.pop(session_id, None)
+        if session is None:
+            return False
+        self.corpus.remove_document(session_id)
+        if self.on_delete is not None:
+            self.on_delete(session_id)
+        return True
+
+    def sync(self) -> int:
+        """Forget local sessions that were deleted through another worker."""
+        shared = self.backend.all()
+        stale = [session_id for session_id in self._sessions if session_id not in shared]
+        for session_id in stale:
+            self._drop_local(session_id)
+        return len(stale)
+
+    # ----- memory accounting -----
+    def account(self, session_id: str) -> int:
+        """Charge a newly READY session and evict others if over budget."""
+        session = self._sessions[session_id]
+        session["memory_bytes"] = self.corpus.document_memory_bytes(session_id)
+        self.enforce_budget(exclude=session_id)
+        return session["memory_bytes"]
+
+    def resident_bytes(self) -> int:
+        return sum(s["memory_bytes"] for s in self._sessions.values() if not s["spilled"])
+
+    def enforce_budget(self, exclude: Optional[str] = None) -> None:
+        now = time.time()
+        candidates = sorted(
+            (
+                (s["last_access"], sid)
+                for sid, s in self._sessions.items()
+                if sid != exclude
+                and s["status"] == READY
+                and not s["spilled"]
+                and now - s["last_access"] >= MIN_RESIDENT_SECONDS
+            ),
+        )
+        for _, session_id in candidates:
+            if self.resident_bytes() <= self.memory_budget_bytes:
+                break
+            self.spill(session_id)
+
+    def spill(self, session_id: str) -> bool:
+        """Make sure the session's vectors are on disk, then drop them from memory."""
+        session = self._sessions[session_id]
+        key = session.get("content_key")
+        if session["spilled"] or not key or not self.corpus.has_document(session_id):
+            return False
+
+        if not self.store.has(key):
+            self.store.save(
+                key,
+                self.corpus.document_chunks(session_id),
+                self.corpus.document_vectors(session_id),
+                None,
+                {"filename": session.get("filename"), "text_length": session.get("text_length", 0),
+                 "page_count": session.get("page_count"),
+                 "chunk_pages": self.corpus.document_pages(session_id) or None},
+            )
+
+        self.corpus.remove_document(session_id)
+        session.update({"retriever": None, "chunks": None, "spilled": True})
+        self.spills += 1
+        print(f"Spilled session {session_id} ({session['memory_bytes'] / (1024 * 1024):.1f} MB) to disk")
+        return True
+
+    async def ensure_resident(self, session_id: str) -> None:
+        """Load a spilled session, or one ingested by another worker, from the IndexStore."""
+        session = self._sessions[session_id]
+        if not session["spilled"]:
+            return
+
+        async with self._load_lock:
+            if not session["spilled"]:
+                return
+            stored = await asyncio.to_thread(self.store.load, session["content_key"])
+            if stored is None:
+                raise RuntimeError("Session data is no longer available on disk; please re-upload")
+            await asyncio.to_thread(self.corpus.add_document, session_id, stored["chunks"], stored["vectors"],
+                                    stored["meta"].get("chunk_pages"))
+            session.update({
+                "retriever": self.make_retriever(session_id),
+                "chunks": self.corpus.document_chunks(session_id),
+                "spilled": False,
+                "memory_bytes": self.corpus.document_memory_bytes(session_id),
+                "last_access": time.time(),
+            })
+            self.reloads += 1
+        self.enforce_budget(exclude=session_id)
+
+    # ----- expiry -----
+    def expire_idle(self) -> int:
+        now = time.time()
+        cutoff = now - self.idle_ttl_seconds
+        # Flush recent local activity first so busy sessions are not expired elsewhere
+        for session_id, session in self._sessions.items():
+            if session["last_access"] > self._touched.get(session_id, 0.0):
+                self._touched[session_id] = session["last_access"]
+                self.backend.touch(session_id, session["last_access"])
+
+        expired = 0
+        for session_id in self.backend.idle_since(cutoff):
+            record = self.backend.get(session_id)
+            if record is not None and record["status"] in (READY, ERROR):
+                del self[session_id]
+                expired += 1
+        self.expirations += expired
+        return expired
+
+    async def run_sweeper(self, interval: float = SESSION_SWEEP_INTERVAL_SECONDS) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.sync()
+                self.expire_idle()
+                self.enforce_budget()
+            except Exception as e:
+                print(f"Session sweep failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": type(self.backend).__name__,
+            "memory_budget_mb": round(self.memory_budget_bytes / (1024 * 1024), 1),
+            "resident_mb": round(self.resident_bytes() / (1024 * 1024), 2),
+            "idle_ttl_seconds": self.idle_ttl_seconds,
+            "resident_sessions": sum(1 for s in self._sessions.values() if not s["spilled"]),
+            "spilled_sessions": sum(1 for s in self._sessions.values() if s["spilled"]),
+            "spills": self.spills,
+            "reloads": self.reloads,
+            "expirations": self.expirations,
+        }
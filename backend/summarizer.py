@@ -1,36 +1,133 @@
-from typing import List
-from llm import query_llm
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+from llm import aquery_llm, llm_client, query_llm
+from llm_cache import ERROR_PREFIX
+
+# Character budget for one prompt; llama3's 8k-token window leaves room for the answer
+MAX_PROMPT_CHARS = 6000
+
+MAP_PROMPT = "Summarize this section concisely, focusing on main points:\n\n{text}"
+REDUCE_PROMPT = "Combine these section summaries into one concise summary, keeping the main points:\n\n{text}"
+FINAL_PROMPT = "Create a comprehensive summary from these section summaries:\n\n{text}"
+
+
+def _pack(texts: List[str], budget: int, separator: str = "\n\n") -> List[str]:
+    """Greedily join consecutive texts into groups that fit the budget."""
+    groups = []
+    current: List[str] = []
+    current_len = 0
+    for text in texts:
+        text = text[:budget]
+        added = len(text) + (len(separator) if current else 0)
+        if current and current_len + added > budget:
+            groups.append(separator.join(current))
+            current, current_len = [], 0
+            added = len(text)
+        current.append(text)
+        current_len += added
+    if current:
+        groups.append(separator.join(current))
+    return groups
+
+
+class MapReduceSummarizer:
+    """Summarize every chunk: concurrent map calls, then a tree of reduce calls.
+
+    Map prompts pack consecutive chunks up to max_prompt_chars. Summaries are
+    re-summarized in groups until they fit a single final prompt. Timing for
+    each level is kept in level_timings.
+    """
+
+    def __init__(
+        self,
+        llm: Callable[..., Awaitable[str]] = aquery_llm,
+        model: str = "llama3",
+        max_prompt_chars: int = MAX_PROMPT_CHARS,
+        max_concurrency: int = llm_client.max_concurrency,
+    ):
+        self.llm = llm
+        self.model = model
+        self.max_prompt_chars = max_prompt_chars
+        self.max_concurrency = max_concurrency
+        self.level_timings: List[Dict[str, Any]] = []
+        self.map_summaries: List[str] = []
+
+    async def _run_level(self, stage: str, template: str, groups: List[str]) -> List[str]:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def call(text: str) -> str:
+            async with semaphore:
+                return await self.llm(template.format(text=text), model=self.model)
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(call(group) for group in groups))
+        elapsed = time.perf_counter() - start
+
+        self.level_timings.append({
+            "level": len(self.level_timings),
+            "stage": stage,
+            "calls": len(groups),
+            "input_chars": sum(len(group) for group in groups),
+            "seconds": round(elapsed, 3),
+        })
+        print(f"Summarization {stage} level: {len(groups)} calls in {elapsed:.2f}s")
+
+        # Drop failed calls so error text never feeds into the next level
+        summaries = [r for r in results if r and not r.startswith(ERROR_PREFIX)]
+        if not summaries:
+            raise RuntimeError(results[0] if results else "No content to summarize")
+        return summaries
+
+    async def summarize(self, chunks: List[str]) -> str:
+        if not chunks:
+            return ""
+        prompt = await self.prepare_final_prompt(chunks)
+        final = await self._run_level("final", "{text}", [prompt])
+        return final[0]
+
+    async def prepare_final_prompt(self, chunks: List[str]) -> str:
+        """Run the map and reduce levels; return the prompt for the final call."""
+        self.level_timings = []
+        map_groups = _pack(chunks, self.max_prompt_chars)
+        summaries = await self._run_level("map", MAP_PROMPT, map_groups)
+        self.map_summaries = summaries
+
+        # Reduce in a tree until everything fits one prompt
+        while True:
+            groups = _pack(summaries, self.max_prompt_chars)
+            if 1 < len(groups) == len(summaries):
+                # Summaries too long to pair up; trim so each level at least halves
+                half = self.max_prompt_chars // 2 - 2
+                groups = _pack([summary[:half] for summary in summaries], self.max_prompt_chars)
+            if len(groups) == 1:
+                return FINAL_PROMPT.format(text=groups[0])
+            summaries = await self._run_level("reduce", REDUCE_PROMPT, groups)
+
+
+async def _threaded_query_llm(prompt: str, model: str = "llama3") -> str:
+    # The sync client is safe to use from any event loop
+    return await asyncio.to_thread(query_llm, prompt, model)
+
 
 class HierarchicalSummarizer:
     def __init__(self, full_text: str, chunks: List[str]):
         self.full_text = full_text
         self.chunks = chunks
         self.chunk_summaries = []
+        self.level_timings = []
         self.final_summary = ""
     
     def generate_summary(self) -> str:
-        """Generate summary using hierarchical approach."""
+        """Generate summary over every chunk using map-reduce."""
         
         print("Starting hierarchical summarization...")
         
-        # Step 1: Summarize chunks in batches
-        batch_size = 5
-        self.chunk_summaries = []
-        
-        for i in range(0, min(len(self.chunks), 20), batch_size):  # Limit to first 20 chunks
-            batch_chunks = self.chunks[i:i + batch_size]
-            batch_text = "\n\n".join(batch_chunks)
-            
-            prompt = f"Summarize this section concisely:\n\n{batch_text[:2000]}"
-            summary = query_llm(prompt, model="llama3")
-            self.chunk_summaries.append(summary)
-            print(f"Summarized batch {i//batch_size + 1}")
-        
-        # Step 2: Combine summaries
-        combined_summaries = "\n\n".join(self.chunk_summaries)
-        
-        prompt = f"Create a comprehensive summary from these section summaries:\n\n{combined_summaries}"
-        self.final_summary = query_llm(prompt, model="llama3")
+        summarizer = MapReduceSummarizer(llm=_threaded_query_llm)
+        self.final_summary = asyncio.run(summarizer.summarize(self.chunks))
+        self.chunk_summaries = summarizer.map_summaries
+        self.level_timings = summarizer.level_timings
         
         print("Summary generation complete!")
         return self.final_summary
@@ -0,0 +1,62 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+from typing import Any, Dict
+
+from fastapi import UploadFile
+
+MAX_UPLOAD_MB = float(os.getenv("MAX_UPLOAD_MB", "200"))
+MAX_UPLOAD_BYTES = int(MAX_UPLOAD_MB * 1024 * 1024)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+def _write_chunk(tmp_file, chunk: bytes) -> None:
+    tmp_file.write(chunk)
+
+
+async def stream_upload_to_disk(
+    upload: UploadFile,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
+) -> Dict[str, Any]:
+    """Copy an upload to a temp file in fixed-size chunks, hashing as it goes.
+
+    At most one chunk is held in memory. Raises UploadTooLarge (after
+    removing the partial file) as soon as max_bytes is exceeded.
+    """
+    sha256 = hashlib.sha256()
+    size = 0
+    started = time.perf_counter()
+
+    tmp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
+    try:
+        with tmp_file:
+            while True:
+                chunk = await upload.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(
+                        f"Upload exceeds the {max_bytes / (1024 * 1024):.0f} MB limit"
+                    )
+                sha256.update(chunk)
+                await asyncio.to_thread(_write_chunk, tmp_file, chunk)
+    except BaseException:
+        os.remove(tmp_file.name)
+        raise
+
+    seconds = time.perf_counter() - started
+    return {
+        "path": tmp_file.name,
+        "sha256": sha256.hexdigest(),
+        "bytes": size,
+        "seconds": round(seconds, 3),
+        "mb_per_second": round(size / (1024 * 1024) / seconds, 2) if seconds > 0 else None,
+    }